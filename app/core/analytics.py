@@ -0,0 +1,166 @@
+"""
+测试报告统计分析
+
+按时间窗口把测试结果的关键列(状态、耗时、用例、环境、报告)一次性读成NumPy数组, 所有指标都通过向量化计算得到,
+百万级数据也能在秒级完成。计算结果缓存在redis中
+"""
+import array
+import asyncio
+from datetime import date
+
+import numpy as np
+from sqlalchemy import select, func
+
+from app.middleware.RedisManager import RedisHelper
+from app.models import async_session
+from app.models.report import PityReport
+from app.models.result import PityTestResult
+from app.models.test_case import TestCase
+from app.models.test_plan import PityTestPlan
+from app.utils.logger import Log
+
+
+class ReportAnalytics(object):
+    log = Log("ReportAnalytics")
+    # 每次从游标中读取的行数
+    partition_size = 10000
+    # 计算的耗时百分位
+    percentiles = (50, 90, 95, 99)
+    # 计算不稳定程度时至少需要的执行次数
+    flaky_min_runs = 3
+    # mysql TO_DAYS与python date序数的差值
+    to_days_offset = 365
+
+    @staticmethod
+    async def load(start_time: str, end_time: str, project_id: int = None, env: int = None):
+        """
+        读取时间窗口内的测试结果, 每列存放在一个紧凑数组中
+        :param start_time: 开始时间
+        :param end_time: 结束时间
+        :param project_id: 项目id, 通过测试计划过滤
+        :param env: 环境
+        :return: 列名 -> 数组
+        """
+        columns = dict(id=array.array("q"), case_id=array.array("q"), report_id=array.array("q"),
+                       env=array.array("q"), status=array.array("b"), day=array.array("l"),
+                       duration=array.array("d"))
+        conditions = [PityTestResult.start_at.between(start_time, end_time), PityTestResult.deleted_at == None]
+        sql = select(PityTestResult.id, PityTestResult.case_id, PityTestResult.report_id, PityReport.env,
+                     PityTestResult.status, func.to_days(PityTestResult.start_at),
+                     PityTestResult.duration) \
+            .join(PityReport, PityReport.id == PityTestResult.report_id)
+        if project_id is not None:
+            sql = sql.join(PityTestPlan, PityTestPlan.id == PityReport.plan_id)
+            conditions.append(PityTestPlan.project_id == project_id)
+        if env is not None:
+            conditions.append(PityReport.env == env)
+        sql = sql.where(*conditions)
+        buffers = list(columns.values())
+        async with async_session() as session:
+            result = await session.stream(sql)
+            async for rows in result.partitions(ReportAnalytics.partition_size):
+                for buffer, col in zip(buffers, zip(*rows)):
+                    if buffer.typecode == "d":
+                        # 历史数据没有耗时, 记为nan
+                        col = [float("nan") if x is None else x for x in col]
+                    buffer.extend(col)
+        return {k: np.frombuffer(v, dtype=v.typecode) if len(v) else np.array([], dtype=v.typecode)
+                for k, v in columns.items()}
+
+    @staticmethod
+    def pass_rate_trend(data: dict):
+        """
+        按天统计通过率
+        """
+        days, inverse = np.unique(data["day"], return_inverse=True)
+        total = np.bincount(inverse, minlength=len(days))
+        passed = np.bincount(inverse, weights=data["status"] == 0, minlength=len(days)).astype(np.int64)
+        rate = np.round(passed / np.maximum(total, 1) * 100, 2)
+        return [dict(date=date.fromordinal(int(d) - ReportAnalytics.to_days_offset).strftime("%Y-%m-%d"),
+                     total=int(t), passed=int(p), pass_rate=float(r))
+                for d, t, p, r in zip(days, total, passed, rate)]
+
+    @staticmethod
+    def case_latency(data: dict):
+        """
+        按用例计算耗时百分位(最近秩法), 按p95倒序
+        """
+        mask = ~np.isnan(data["duration"])
+        case_id, duration = data["case_id"][mask], data["duration"][mask]
+        if len(case_id) == 0:
+            return []
+        order = np.lexsort((duration, case_id))
+        case_id, duration = case_id[order], duration[order]
+        cases, start, count = np.unique(case_id, return_index=True, return_counts=True)
+        stats = dict(count=count, avg=np.round(np.add.reduceat(duration, start) / count, 2),
+                     max=duration[start + count - 1])
+        for p in ReportAnalytics.percentiles:
+            rank = np.maximum(np.ceil(p / 100 * count).astype(np.int64) - 1, 0)
+            stats[f"p{p}"] = duration[start + rank]
+        order = np.argsort(-stats["p95"], kind="stable")
+        stats = {k: v[order].tolist() for k, v in stats.items()}
+        return [dict(case_id=c, **{k: v[i] for k, v in stats.items()}) for i, c in enumerate(cases[order].tolist())]
+
+    @staticmethod
+    def flakiness(data: dict):
+        """
+        计算用例在同一环境下相邻两次执行结果发生翻转(成功<->失败)的比例, 按比例倒序
+        """
+        order = np.lexsort((data["id"], data["report_id"], data["env"], data["case_id"]))
+        case_id, env = data["case_id"][order], data["env"][order]
+        passed = data["status"][order] == 0
+        # 相邻两条属于同一用例同一环境时才算一次转换
+        same = (case_id[1:] == case_id[:-1]) & (env[1:] == env[:-1])
+        flip = same & (passed[1:] != passed[:-1])
+        cases, inverse = np.unique(case_id, return_inverse=True)
+        runs = np.bincount(inverse, minlength=len(cases))
+        transitions = np.bincount(inverse[1:], weights=same, minlength=len(cases))
+        flips = np.bincount(inverse[1:], weights=flip, minlength=len(cases))
+        failed = np.bincount(inverse, weights=~passed, minlength=len(cases))
+        score = np.round(flips / np.maximum(transitions, 1), 4)
+        mask = (runs >= ReportAnalytics.flaky_min_runs) & (flips > 0)
+        order = np.argsort(-score[mask], kind="stable")
+        return [dict(case_id=int(c), runs=int(r), flips=int(f), failed=int(fa), flaky_score=float(s))
+                for c, r, f, fa, s in zip(cases[mask][order], runs[mask][order], flips[mask][order],
+                                          failed[mask][order], score[mask][order])]
+
+    @staticmethod
+    def compute(data: dict):
+        total = len(data["status"])
+        return dict(total=total,
+                    pass_rate=round(float(np.count_nonzero(data["status"] == 0)) / total * 100, 2) if total else 0,
+                    trend=ReportAnalytics.pass_rate_trend(data),
+                    latency=ReportAnalytics.case_latency(data),
+                    flaky=ReportAnalytics.flakiness(data))
+
+    @staticmethod
+    async def fill_case_name(*items):
+        """
+        补充用例名称
+        """
+        case_ids = {x["case_id"] for data in items for x in data}
+        if not case_ids:
+            return
+        async with async_session() as session:
+            result = await session.execute(select(TestCase.id, TestCase.name).where(TestCase.id.in_(case_ids)))
+            names = dict(result.all())
+        for data in items:
+            for x in data:
+                x["case_name"] = names.get(x["case_id"])
+
+    @staticmethod
+    @RedisHelper.cache("analytics:", 10 * 60)
+    async def analyze(start_time: str, end_time: str, project_id: int = None, env: int = None):
+        """
+        统计时间窗口内的测试结果, 参数需按位置传入以生成缓存key
+        :return: 总数, 总通过率, 通过率趋势, 用例耗时百分位(按p95倒序), 不稳定用例(按翻转比例倒序)
+        """
+        try:
+            data = await ReportAnalytics.load(start_time, end_time, project_id, env)
+            # 计算过程是cpu密集的, 放到线程池中执行避免阻塞事件循环
+            ans = await asyncio.get_running_loop().run_in_executor(None, ReportAnalytics.compute, data)
+            await ReportAnalytics.fill_case_name(ans["latency"], ans["flaky"])
+            return ans
+        except Exception as e:
+            ReportAnalytics.log.error(f"统计测试结果失败, error: {e}")
+            raise Exception(f"统计测试结果失败: {e}")
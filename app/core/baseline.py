@@ -0,0 +1,89 @@
+"""
+用例耗时基线, 用于性能回归断言
+
+每个(用例, 环境)在redis中维护一个最近N次成功执行的请求耗时列表, 用例执行成功后增量写入,
+列表为空时从历史测试结果中初始化
+"""
+from sqlalchemy import select
+
+from app.crud.test_case.TestResult import TestResultDao
+from app.middleware.RedisManager import RedisHelper
+from app.models import async_session
+from app.models.report import PityReport
+from app.models.result import PityTestResult
+from app.utils.logger import Log
+from config import Config
+
+
+class LatencyBaseline(object):
+    log = Log("LatencyBaseline")
+    # 长期不执行的用例基线自动过期
+    expired_time = 7 * 24 * 3600
+
+    @staticmethod
+    def key(case_id: int, env: int):
+        return RedisHelper.get_key("latency_baseline:", case_id, env)
+
+    @staticmethod
+    async def load(case_id: int, env: int):
+        """
+        从测试结果中查询最近N次成功执行的请求耗时
+        :return: 由新到旧的耗时列表
+        """
+        async with async_session() as session:
+            sql = select(PityTestResult.request_cost) \
+                .join(PityReport, PityReport.id == PityTestResult.report_id) \
+                .where(PityTestResult.case_id == case_id, PityReport.env == env, PityTestResult.status == 0,
+                       PityTestResult.request_cost != None, PityTestResult.deleted_at == None) \
+                .order_by(PityTestResult.id.desc()).limit(Config.LATENCY_BASELINE_RUNS)
+            result = await session.execute(sql)
+            return result.scalars().all()
+
+    @staticmethod
+    async def get(case_id: int, env: int):
+        """
+        获取用例在该环境下的耗时基线(最近N次成功执行的p95)
+        :param case_id:
+        :param env:
+        :return: 基线耗时(ms), 样本数量
+        """
+        key = LatencyBaseline.key(case_id, env)
+        try:
+            samples = [int(x) for x in await RedisHelper.pity_redis_client.lrange(key, 0, -1)]
+            if not samples:
+                samples = await LatencyBaseline.load(case_id, env)
+                if samples:
+                    pipe = RedisHelper.pity_redis_client.pipeline()
+                    pipe.rpush(key, *samples)
+                    pipe.ltrim(key, 0, Config.LATENCY_BASELINE_RUNS - 1)
+                    pipe.expire(key, LatencyBaseline.expired_time)
+                    await pipe.execute()
+        except Exception as e:
+            LatencyBaseline.log.error(f"获取用例: {case_id}耗时基线失败, error: {e}")
+            return None, 0
+        if len(samples) < Config.LATENCY_BASELINE_MIN_RUNS:
+            return None, len(samples)
+        return TestResultDao.percentile(sorted(samples), Config.LATENCY_BASELINE_PERCENTILE), len(samples)
+
+    @staticmethod
+    async def record(case_id: int, env: int, request_cost: int):
+        """
+        用例执行成功后写入本次耗时, 只更新已经初始化过的基线, 未初始化的在下次读取时从数据库加载
+        :param case_id:
+        :param env:
+        :param request_cost: 请求耗时(ms)
+        :return:
+        """
+        if request_cost is None:
+            return
+        key = LatencyBaseline.key(case_id, env)
+        try:
+            if not await RedisHelper.pity_redis_client.exists(key):
+                return
+            pipe = RedisHelper.pity_redis_client.pipeline()
+            pipe.lpush(key, request_cost)
+            pipe.ltrim(key, 0, Config.LATENCY_BASELINE_RUNS - 1)
+            pipe.expire(key, LatencyBaseline.expired_time)
+            await pipe.execute()
+        except Exception as e:
+            LatencyBaseline.log.error(f"更新用例: {case_id}耗时基线失败, error: {e}")
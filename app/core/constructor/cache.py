@@ -0,0 +1,91 @@
+"""
+构造方法结果缓存
+
+只读的sql/redis构造方法可以在constructor_json中标记cache: true, 相同环境、相同数据源下
+去掉首尾空白后一致的语句共享结果:
+    cache_ttl > 0: 在当前进程缓存cache_ttl秒
+    cache_ttl为空: 只在本次测试计划执行期间缓存, 不在测试计划中执行时不缓存
+同一时刻相同的语句只会真正执行一次, 其他请求等待它的结果
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from config import Config
+
+
+class ConstructorCache(object):
+    # 按ttl缓存的结果: key -> (过期时间, 结果), 按最近使用排序
+    _local = OrderedDict()
+    # 正在执行的语句: key -> Future
+    _inflight = dict()
+    # 测试计划执行期间的缓存, 由run_multiple设置
+    plan_scope: ContextVar = ContextVar("constructor_plan_scope", default=None)
+
+    @staticmethod
+    def normalize(statement: str):
+        """
+        只去掉首尾的空白字符, 语句中间的空白、大小写和分号可能属于字符串常量或redis命令的参数, 保持不变
+        """
+        return (statement or "").strip()
+
+    @staticmethod
+    def key(kind: str, env: int, source: str, statement: str):
+        return kind, env, source, ConstructorCache.normalize(statement)
+
+    @staticmethod
+    def lookup(key, scope):
+        if scope is not None and key in scope:
+            return True, scope[key]
+        cache = ConstructorCache._local.get(key)
+        if cache is not None:
+            if cache[0] > time.time():
+                ConstructorCache._local.move_to_end(key)
+                return True, cache[1]
+            ConstructorCache._local.pop(key, None)
+        return False, None
+
+    @staticmethod
+    def store(key, value, ttl: int, scope):
+        if ttl:
+            ConstructorCache._local[key] = (time.time() + ttl, value)
+            ConstructorCache._local.move_to_end(key)
+            while len(ConstructorCache._local) > Config.CONSTRUCTOR_CACHE_SIZE:
+                ConstructorCache._local.popitem(last=False)
+        elif scope is not None:
+            scope[key] = value
+
+    @staticmethod
+    async def get(key, loader, ttl: int = None):
+        """
+        获取缓存结果, 不存在则调用loader并缓存
+        :param key: ConstructorCache.key生成的key
+        :param loader: 无参数的异步方法, 返回需要缓存的结果
+        :param ttl: 缓存时间(秒), 为空则只在测试计划执行期间缓存
+        :return: 结果, 是否命中缓存
+        """
+        scope = ConstructorCache.plan_scope.get()
+        if not ttl and scope is None:
+            return await loader(), False
+        hit, value = ConstructorCache.lookup(key, scope)
+        if hit:
+            return value, True
+        inflight = ConstructorCache._inflight.get(key)
+        if inflight is not None:
+            # 相同的语句正在执行, 等待它的结果
+            return await asyncio.shield(inflight), True
+        future = asyncio.get_running_loop().create_future()
+        ConstructorCache._inflight[key] = future
+        try:
+            value = await loader()
+            ConstructorCache.store(key, value, ttl, scope)
+            future.set_result(value)
+            return value, False
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他请求等待时避免出现未获取异常的警告
+            future.exception()
+            raise
+        finally:
+            ConstructorCache._inflight.pop(key, None)
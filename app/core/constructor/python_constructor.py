@@ -1,26 +1,24 @@
 import json
 
-from awaits.awaitable import awaitable
-
 from app.core.constructor.constructor import ConstructorAbstract
+from app.core.script_runner import ScriptRunner
 from app.models.constructor import Constructor
 
 
 class PythonConstructor(ConstructorAbstract):
 
     @staticmethod
-    @awaitable
-    def run(executor, env, index, path, params, req_params, constructor: Constructor, **kwargs):
+    async def run(executor, env, index, path, params, req_params, constructor: Constructor, **kwargs):
         try:
             executor.append(f"当前路径: {path}, 第{index + 1}条构造方法")
             script = json.loads(constructor.constructor_json)
             command = script['command']
             executor.append(f"当前构造方法类型为python脚本\n{command}")
-            loc = dict()
-            exec(command, loc)
-            py_data = loc[constructor.value]
+            # 构造方法可以单独配置超时时间(ms)
+            py_data = await ScriptRunner.run(command, constructor.value, script.get("timeout"), required=True)
             if not isinstance(py_data, str):
-                py_data = json.dumps(params[constructor.value], ensure_ascii=False)
+                py_data = json.dumps(py_data, ensure_ascii=False)
+            params[constructor.value] = py_data
             executor.append(f"当前构造方法返回变量: {constructor.value}\n返回值:\n {py_data}\n")
         except Exception as e:
             raise Exception(f"{path}->{constructor.name} 第{index + 1}个构造方法执行失败: {e}")
@@ -1,13 +1,14 @@
 import json
 
-from awaits.awaitable import awaitable
-
+from app.core.constructor.cache import ConstructorCache
 from app.core.constructor.constructor import ConstructorAbstract
 from app.crud.config.RedisConfigDao import PityRedisConfigDao
 from app.models.constructor import Constructor
 
 
 class RedisConstructor(ConstructorAbstract):
+    # pipeline模式日志中最多展示的命令数
+    log_commands = 10
 
     @staticmethod
     async def run(executor, env, index, path, params, req_params, constructor: Constructor, **kwargs):
@@ -15,10 +16,44 @@ class RedisConstructor(ConstructorAbstract):
             executor.append(f"当前路径: {path}, 第{index + 1}条构造方法")
             data = json.loads(constructor.constructor_json)
             redis = data.get("redis")
-            command = data.get("command")
-            executor.append(f"当前构造方法类型为redis, 名称: {redis}\n命令: {command}\n")
-            command_result = await PityRedisConfigDao.execute_command(command=command, name=redis, env=env)
+            statement, loader = RedisConstructor.get_loader(executor, env, redis, data)
+            if data.get("cache"):
+                command_result, hit = await ConstructorCache.get(
+                    ConstructorCache.key("redis", env, redis, statement), loader, data.get("cache_ttl"))
+                if hit:
+                    executor.append("命中构造方法缓存\n")
+            else:
+                command_result = await loader()
             params[constructor.value] = command_result
             executor.append(f"当前构造方法返回变量: {constructor.value}\n返回值:\n {command_result}\n")
         except Exception as e:
             raise Exception(f"{path}->{constructor.name} 第{index + 1}个构造方法执行失败: {e}")
+
+    @staticmethod
+    def get_loader(executor, env, redis: str, data: dict):
+        """
+        根据构造方法的模式生成执行方法
+            command: 单条命令
+            commands: 命令列表, 通过pipeline一次发送, transaction为true时使用MULTI/EXEC
+            script: lua脚本, 配合keys/args使用, 通过EVALSHA执行
+        :return: 用于缓存的语句, 执行方法
+        """
+        if data.get("script"):
+            script, keys, args = data.get("script"), data.get("keys") or [], data.get("args") or []
+            executor.append(f"当前构造方法类型为redis脚本, 名称: {redis}\n脚本: {script}\n"
+                            f"keys: {keys}\nargs: {args}\n")
+            return json.dumps([script, keys, args], ensure_ascii=False), \
+                lambda: PityRedisConfigDao.execute_script(script, keys, args, name=redis, env=env)
+        if data.get("commands"):
+            commands, transaction = data.get("commands"), data.get("transaction", False)
+            # 命令较多时只记录前几条
+            shown = "\n".join(commands[:RedisConstructor.log_commands])
+            if len(commands) > RedisConstructor.log_commands:
+                shown += f"\n...(共{len(commands)}条)"
+            executor.append(f"当前构造方法类型为redis pipeline, 名称: {redis}, 命令数: {len(commands)}, "
+                            f"事务: {transaction}\n命令: {shown}\n")
+            return json.dumps(commands, ensure_ascii=False), \
+                lambda: PityRedisConfigDao.execute_pipeline(commands, transaction, name=redis, env=env)
+        command = data.get("command")
+        executor.append(f"当前构造方法类型为redis, 名称: {redis}\n命令: {command}\n")
+        return command, lambda: PityRedisConfigDao.execute_command(command=command, name=redis, env=env)
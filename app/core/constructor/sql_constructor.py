@@ -1,5 +1,6 @@
 import json
 
+from app.core.constructor.cache import ConstructorCache
 from app.core.constructor.constructor import ConstructorAbstract
 from app.crud.config.DbConfigDao import DbConfigDao
 from app.models.constructor import Constructor
@@ -15,7 +16,15 @@ class SqlConstructor(ConstructorAbstract):
             database = data.get("database")
             sql = data.get("sql")
             executor.append(f"当前构造方法类型为sql, 数据库名: {database}\nsql: {sql}\n")
-            sql_data = await DbConfigDao.execute_sql(env, database, sql)
+            # 构造方法可以单独配置超时时间(ms), 否则使用数据源的配置
+            if data.get("cache"):
+                sql_data, hit = await ConstructorCache.get(
+                    ConstructorCache.key("sql", env, database, sql),
+                    lambda: DbConfigDao.execute_sql(env, database, sql, data.get("timeout")), data.get("cache_ttl"))
+                if hit:
+                    executor.append("命中构造方法缓存\n")
+            else:
+                sql_data = await DbConfigDao.execute_sql(env, database, sql, data.get("timeout"))
             params[constructor.value] = sql_data
             executor.append(f"当前构造方法返回变量: {constructor.value}\n返回值:\n {sql_data}\n")
         except Exception as e:
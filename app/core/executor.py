@@ -6,10 +6,14 @@ from collections import defaultdict
 from datetime import datetime
 from typing import List, Any
 
+from app.core.baseline import LatencyBaseline
+from app.core.constructor.cache import ConstructorCache
 from app.core.constructor.case_constructor import TestcaseConstructor
 from app.core.constructor.python_constructor import PythonConstructor
 from app.core.constructor.redis_constructor import RedisConstructor
 from app.core.constructor.sql_constructor import SqlConstructor
+from app.core.fail_fast import FailFastGuard
+from app.core.planner import JobPlanner
 from app.core.msg.mail import Email
 from app.crud.auth.UserDao import UserDao
 from app.crud.config.EnvironmentDao import EnvironmentDao
@@ -38,6 +42,8 @@ class Executor(object):
     pattern = re.compile(el_exp)
     # 需要替换全局变量的字段
     fields = ['body', 'url', 'request_headers']
+    # 耗时断言, 实际值固定为本次请求耗时
+    latency_asserts = ("latency_lt_ms", "latency_within_baseline_pct")
 
     def __init__(self, log: CaseLog = None):
         if log is None:
@@ -46,6 +52,8 @@ class Executor(object):
         else:
             self._logger = log
             self._main = False
+        # 耗时基线(ms), 样本数量
+        self.baseline = None
 
     @property
     def logger(self):
@@ -274,6 +282,10 @@ class Executor(object):
             if err:
                 return response_info, err
 
+            # 存在基线断言时获取历史耗时基线, 需要在本次结果写入前获取
+            if any(a.assert_type == "latency_within_baseline_pct" for a in asserts):
+                self.baseline = await LatencyBaseline.get(case_id, env)
+
             # Step4: 替换参数
             self.replace_args(req_params, case_info, constructors, asserts)
 
@@ -360,14 +372,28 @@ class Executor(object):
         for a in asserts:
             self.replace_cls(params, a, "expected")
 
+    @staticmethod
+    def sample(text: str, storage_policy: int):
+        """
+        成功用例按存储策略截取样本
+        """
+        if storage_policy != Config.ResultStorage.failed_with_sample or not text:
+            return None
+        if len(text) <= Config.RESULT_SAMPLE_SIZE:
+            return text
+        return text[:Config.RESULT_SAMPLE_SIZE] + f"\n...(已截断, 原长度: {len(text)})"
+
     @staticmethod
     async def run_with_test_data(env, data, report_id, case_id, params_pool: dict = None,
-                                 request_param: dict = None, path='主case', name: str = ""):
+                                 request_param: dict = None, path='主case', name: str = "",
+                                 storage_policy: int = Config.ResultStorage.full):
         start_at = datetime.now()
+        st = time.perf_counter()
         executor = Executor()
         result, err = await executor.run(env, case_id, params_pool, request_param, path)
+        duration = round((time.perf_counter() - st) * 1000)
         finished_at = datetime.now()
-        cost = "{}s".format((finished_at - start_at).seconds)
+        cost = "%.2fs" % (duration / 1000)
         if err is not None:
             status = 2
         else:
@@ -386,24 +412,42 @@ class Executor(object):
         case_name = result.get("case_name")
         response_headers = result.get("response_headers")
         cookies = result.get("cookies")
+        if status == 0 and storage_policy != Config.ResultStorage.full:
+            # 成功的用例只保留概要信息
+            response = Executor.sample(response, storage_policy)
+            case_logs = Executor.sample(case_logs, storage_policy)
+            request_headers, response_headers, cookies = None, None, None
+        if status == 0:
+            await LatencyBaseline.record(case_id, env, result.get("request_cost"))
         req = json.dumps(request_param, ensure_ascii=False)
         data[case_id].append(status)
         await TestResultDao.insert(report_id, case_id, case_name, status,
                                    case_logs, start_at, finished_at,
                                    url, body, request_method, request_headers, cost,
                                    asserts, response_headers, response,
-                                   status_code, cookies, 0, req, name)
+                                   status_code, cookies, 0, req, name, duration, result.get("request_cost"))
+        return status
 
     @staticmethod
-    async def run_single(env: int, data, report_id, case_id, params_pool: dict = None, path="主case"):
+    async def run_single(env: int, data, report_id, case_id, params_pool: dict = None, path="主case",
+                         storage_policy: int = Config.ResultStorage.full):
 
         test_data = await PityTestcaseDataDao.list_testcase_data_by_env(env, case_id)
         await asyncio.gather(
             *(Executor.run_with_test_data(env, data, report_id, case_id, params_pool, Executor.get_dict(x.json_data),
                                           path,
-                                          x.name)
+                                          x.name, storage_policy)
               for x in test_data))
 
+    @staticmethod
+    async def get_jobs(env: int, case_list: List[int]):
+        """
+        获取用例在当前环境下的测试数据, 每条测试数据是一个执行任务
+        :return: [(case_id, [测试数据])]
+        """
+        test_data = await asyncio.gather(*(PityTestcaseDataDao.list_testcase_data_by_env(env, c) for c in case_list))
+        return list(zip(case_list, test_data))
+
     @case_log
     def replace_body(self, req_params, body, body_type=1):
         """根据传入的构造参数进行参数替换"""
@@ -442,6 +486,16 @@ class Executor(object):
                 ans = False
                 result[item.id] = {"status": False, "msg": f"解析变量失败, {err}"}
                 continue
+            if item.assert_type in Executor.latency_asserts:
+                try:
+                    status, err = self.latency_ops(item.assert_type, self.translate(a),
+                                                   response_info.get("request_cost"))
+                except Exception as e:
+                    status, err = False, f"耗时断言失败: {e}"
+                result[item.id] = {"status": status, "msg": err}
+                if not status:
+                    ans = False
+                continue
             b, err = self.parse_variable(response_info, item.actually)
             if err:
                 ans = False
@@ -514,6 +568,29 @@ class Executor(object):
             return False, data
         return False, "不支持的断言方式💔"
 
+    @case_log
+    def latency_ops(self, assert_type: str, expected, cost) -> (bool, str):
+        """
+        耗时断言
+        :param assert_type: latency_lt_ms: 耗时小于expected毫秒, latency_within_baseline_pct: 耗时不超过基线的expected%
+        :param expected: 预期值
+        :param cost: 本次请求耗时(ms)
+        """
+        if cost is None:
+            return False, "未获取到请求耗时💔"
+        if assert_type == "latency_lt_ms":
+            if cost < expected:
+                return True, f"请求耗时: {cost}ms ✔ 小于 ✔ {expected}ms"
+            return False, f"请求耗时: {cost}ms ❌ 不小于 ❌ {expected}ms"
+        baseline, count = self.baseline or (None, 0)
+        if baseline is None:
+            return True, f"历史成功样本不足{Config.LATENCY_BASELINE_MIN_RUNS}次(当前{count}次), 跳过基线校验"
+        limit = baseline * (1 + expected / 100)
+        msg = f"基线p{Config.LATENCY_BASELINE_PERCENTILE}: {baseline}ms, 允许上浮{expected}%(上限{limit:.0f}ms)"
+        if cost <= limit:
+            return True, f"请求耗时: {cost}ms ✔ 未超过基线 ✔ {msg}"
+        return False, f"请求耗时: {cost}ms ❌ 超过基线 ❌ {msg}"
+
     def get_el_expression(self, string: str):
         """获取字符串中的el表达式
         """
@@ -583,7 +660,10 @@ class Executor(object):
             report_dict = dict()
             await asyncio.gather(
                 *(Executor.run_multiple(executor, int(e), case_list, mode=1,
-                                        plan_id=plan.id, ordered=plan.ordered, report_dict=report_dict) for e in env))
+                                        plan_id=plan.id, ordered=plan.ordered, report_dict=report_dict,
+                                        storage_policy=plan.storage_policy, pass_rate=plan.pass_rate,
+                                        fail_fast=plan.fail_fast, error_threshold=plan.error_threshold)
+                  for e in env))
             await PityTestPlanDao.update_test_plan_state(plan.id, 0)
             await PityTestPlanDao.update_test_plan(plan, plan.update_user)
             # TODO 后续通知部分
@@ -601,7 +681,8 @@ class Executor(object):
 
     @staticmethod
     async def run_multiple(executor: int, env: int, case_list: List[int], mode=0, plan_id: int = None, ordered=False,
-                           report_dict: dict = None):
+                           report_dict: dict = None, storage_policy: int = Config.ResultStorage.full,
+                           pass_rate: int = 0, fail_fast: bool = False, error_threshold: int = 0):
         current_env = await EnvironmentDao.query_env(env)
         if current_env.deleted_at:
             return
@@ -617,13 +698,58 @@ class Executor(object):
         result_data = defaultdict(list)
         # step3: 将报告改为 running状态
         await TestReportDao.update(report_id, 1)
-        # step4: 执行用例并搜集数据
+        # step4: 执行用例并搜集数据, 标记了缓存的构造方法在本次执行期间共享结果
+        token = ConstructorCache.plan_scope.set(dict())
+        # 无序执行时任务按LPT顺序排队占用有限的执行槽, 不限制并发时排序没有意义;
+        # 顺序执行只在开启快速失败时限制并发, 让快速失败后未开始的测试数据能够及时跳过
+        concurrency = Config.PLAN_MAX_CONCURRENCY if fail_fast or not ordered else None
+        jobs = await Executor.get_jobs(env, case_list)
+        estimate = await JobPlanner.estimate(env, case_list)
         if not ordered:
-            await asyncio.gather(*(Executor.run_single(env, result_data, report_id, c) for c in case_list))
+            # 无序执行时按历史耗时从长到短排列
+            jobs = JobPlanner.sort([(c, x) for c, data in jobs for x in data], estimate)
+            durations = [estimate[c] for c, _ in jobs] if estimate else []
+            predicted = JobPlanner.makespan(durations, concurrency)
         else:
-            # 顺序执行
-            for c in case_list:
-                await Executor.run_single(env, result_data, report_id, c)
+            # 顺序执行时用例之间串行, 同一用例的测试数据并行
+            predicted = sum(JobPlanner.makespan([estimate[c]] * len(data), concurrency)
+                            for c, data in jobs) if estimate else 0
+        predicted_cost = "%.2f" % (predicted / 1000) if estimate else None
+        total = len(jobs) if not ordered else sum(len(data) for _, data in jobs)
+        guard = FailFastGuard(total, pass_rate, error_threshold) if fail_fast else None
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        skipped = list()
+
+        async def execute_job(case_id, test_data):
+            if guard is not None and guard.stopped:
+                # 快速失败, 未开始的用例直接跳过
+                skipped.append((case_id, test_data.name, test_data.json_data))
+                result_data[case_id].append(3)
+                return
+            status = await Executor.run_with_test_data(env, result_data, report_id, case_id,
+                                                       request_param=Executor.get_dict(test_data.json_data),
+                                                       name=test_data.name, storage_policy=storage_policy)
+            if guard is not None:
+                guard.add(status)
+
+        async def run_job(case_id, test_data):
+            if semaphore is None:
+                return await execute_job(case_id, test_data)
+            async with semaphore:
+                return await execute_job(case_id, test_data)
+
+        try:
+            if not ordered:
+                await asyncio.gather(*(run_job(c, x) for c, x in jobs))
+            else:
+                # 顺序执行
+                for c, data in jobs:
+                    await asyncio.gather(*(run_job(c, x) for x in data))
+        finally:
+            ConstructorCache.plan_scope.reset(token)
+        if skipped:
+            Executor.log.info(f"报告: {report_id}触发快速失败, {guard.reason}, 跳过{len(skipped)}条测试数据")
+            await TestResultDao.insert_skipped(report_id, skipped, f"快速失败, 跳过执行: {guard.reason}")
         ok, fail, skip, error = 0, 0, 0, 0
         for case_id, status in result_data.items():
             for s in status:
@@ -638,7 +764,7 @@ class Executor(object):
         cost = time.perf_counter() - st
         cost = "%.2f" % cost
         # step5: 回写数据到报告
-        report = await TestReportDao.end(report_id, ok, fail, error, skip, 3, cost)
+        report = await TestReportDao.end(report_id, ok, fail, error, skip, 3, cost, predicted_cost)
         if report_dict is not None:
             report_dict[env] = {
                 "report_url": f"{Config.SERVER_REPORT}{report_id}",
@@ -650,7 +776,9 @@ class Executor(object):
                 "skip": skip,
                 "executor": name,
                 "cost": cost,
+                "predicted_cost": predicted_cost,
                 "plan_result": "通过" if ok + fail + error + skip > 0 and fail + error == 0 else '未通过',
                 "env": current_env.name,
+                "fail_fast": guard.reason if guard is not None else None,
             }
         return report_id
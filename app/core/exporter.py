@@ -0,0 +1,232 @@
+"""
+测试报告导出, 通过服务端游标逐行读取测试结果并以流的方式返回，不会把整个报告加载到内存
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qsl
+
+from sqlalchemy import select
+
+from app.crud.test_case.TestResult import TestResultDao
+from app.handler.fatcory import PityResponse
+from app.models import async_session
+from app.models.response_blob import PityResponseBlob
+from app.models.result import PityTestResult
+from app.utils.compressor import TextCompressor
+
+
+class ReportExporter(object):
+    # 可导出的字段
+    fields = [c.name for c in PityTestResult.__table__.columns if c.name not in ("response_hash", "deleted_at")]
+    # 攒够这么多字节再输出一次
+    chunk_size = 64 * 1024
+
+    media_types = {
+        "ndjson": "application/x-ndjson",
+        "csv": "text/csv",
+        "har": "application/json",
+    }
+    # 生成HAR需要的字段
+    har_fields = ["case_id", "case_name", "data_name", "start_at", "request_cost", "url", "request_method",
+                  "request_headers", "body", "status_code", "response_headers", "response", "cookies"]
+
+    @staticmethod
+    def parse_columns(columns: str = None):
+        """
+        解析导出字段, 以逗号分隔, 为空则导出全部字段
+        :param columns:
+        :return:
+        """
+        if not columns:
+            return list(ReportExporter.fields)
+        ans = [c.strip() for c in columns.split(",") if c.strip()]
+        invalid = [c for c in ans if c not in ReportExporter.fields]
+        if invalid:
+            raise Exception(f"不支持的导出字段: {', '.join(invalid)}")
+        return ans
+
+    @staticmethod
+    async def iter_results(report_id: int, columns: list, status: int = None, case_id: int = None,
+                           serialize: bool = True):
+        """
+        使用服务端游标逐行读取测试结果, 并解压大字段
+        :param report_id:
+        :param columns: 需要的字段
+        :param status: 执行状态过滤
+        :param case_id: 用例id过滤
+        :param serialize: 是否将时间格式化为字符串
+        :return: 每条测试结果对应的dict
+        """
+        fields = [getattr(PityTestResult, c) for c in columns]
+        with_response = "response" in columns
+        if with_response:
+            fields.extend([PityTestResult.response_hash, PityResponseBlob.content.label("response_blob")])
+        conditions = [PityTestResult.report_id == report_id, PityTestResult.deleted_at == None]
+        if status is not None:
+            conditions.append(PityTestResult.status == status)
+        if case_id is not None:
+            conditions.append(PityTestResult.case_id == case_id)
+        sql = select(*fields).where(*conditions).order_by(PityTestResult.id)
+        if with_response:
+            sql = sql.outerjoin(PityResponseBlob, PityResponseBlob.hash == PityTestResult.response_hash)
+        async with async_session() as session:
+            result = await session.stream(sql)
+            async for row in result.mappings():
+                data = dict()
+                for c in columns:
+                    value = row[c]
+                    if c in TestResultDao.compress_fields:
+                        value = TextCompressor.decompress(value)
+                    data[c] = value
+                if with_response and row["response_hash"]:
+                    data["response"] = TextCompressor.decompress(row["response_blob"])
+                yield PityResponse.json_serialize(data) if serialize else data
+
+    @staticmethod
+    def har_pairs(data: str):
+        """
+        将json格式的headers/cookies转换为HAR中的name-value列表
+        """
+        if not data:
+            return []
+        try:
+            return [dict(name=k, value=str(v)) for k, v in json.loads(data).items()]
+        except (ValueError, AttributeError):
+            return []
+
+    @staticmethod
+    def har_mime_type(headers: list, default: str = ""):
+        for h in headers:
+            if h["name"].lower() == "content-type":
+                return h["value"]
+        return default
+
+    @staticmethod
+    def har_entry(row: dict):
+        """
+        将一条测试结果转换为HAR 1.2中的entry
+        """
+        request_headers = ReportExporter.har_pairs(row.get("request_headers"))
+        response_headers = ReportExporter.har_pairs(row.get("response_headers"))
+        start_at = row.get("start_at")
+        # 只统计http请求的耗时, 不包含构造方法、断言等步骤; 没有发出请求的记录为0
+        elapsed = row.get("request_cost") or 0
+        url = row.get("url") or ""
+        body = row.get("body")
+        response = row.get("response") or ""
+        status_code = row.get("status_code") or 0
+        try:
+            status_text = HTTPStatus(status_code).phrase
+        except ValueError:
+            status_text = ""
+        request = dict(method=row.get("request_method") or "GET", url=url, httpVersion="HTTP/1.1",
+                       cookies=[], headers=request_headers,
+                       queryString=[dict(name=k, value=v) for k, v in parse_qsl(urlsplit(url).query)],
+                       headersSize=-1, bodySize=len(body.encode("utf-8")) if body else 0)
+        if body:
+            request["postData"] = dict(mimeType=ReportExporter.har_mime_type(request_headers), text=body)
+        size = len(response.encode("utf-8"))
+        return dict(
+            startedDateTime=(start_at or datetime.now()).astimezone().isoformat(),
+            time=elapsed,
+            request=request,
+            response=dict(status=status_code, statusText=status_text, httpVersion="HTTP/1.1",
+                          cookies=ReportExporter.har_pairs(row.get("cookies")), headers=response_headers,
+                          content=dict(size=size, mimeType=ReportExporter.har_mime_type(response_headers),
+                                       text=response),
+                          redirectURL="", headersSize=-1, bodySize=size),
+            cache=dict(),
+            timings=dict(send=0, wait=elapsed, receive=0),
+            comment=f"{row.get('case_name')}({row.get('case_id')}) {row.get('data_name') or ''}".strip(),
+        )
+
+    @staticmethod
+    async def to_har(rows):
+        """
+        逐条输出HAR文档, 不在内存中构建整个文档
+        """
+        header = json.dumps(dict(version="1.2", creator=dict(name="pity", version="1.0")), ensure_ascii=False)
+        yield '{"log": ' + header[:-1] + ', "pages": [], "entries": ['
+        first = True
+        async for row in rows:
+            entry = json.dumps(ReportExporter.har_entry(row), ensure_ascii=False)
+            yield entry if first else "," + entry
+            first = False
+        yield "]}}"
+
+    @staticmethod
+    async def to_ndjson(rows):
+        async for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+    @staticmethod
+    async def to_csv(rows, columns: list):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        async for row in rows:
+            writer.writerow([row.get(c) for c in columns])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        # 只有表头时也需要输出
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    @staticmethod
+    async def encode(lines, gzip: bool = False):
+        """
+        将文本流编码为字节流, 攒够chunk_size再输出, 可选边读边gzip压缩
+        :param lines:
+        :param gzip:
+        :return:
+        """
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if gzip else None
+        buffer = list()
+        size = 0
+        async for line in lines:
+            data = line.encode("utf-8")
+            if compressor is not None:
+                data = compressor.compress(data)
+            if not data:
+                continue
+            buffer.append(data)
+            size += len(data)
+            if size >= ReportExporter.chunk_size:
+                yield b"".join(buffer)
+                buffer, size = list(), 0
+        if compressor is not None:
+            buffer.append(compressor.flush())
+        if buffer:
+            yield b"".join(buffer)
+
+    @staticmethod
+    def export(report_id: int, fmt: str = "ndjson", columns: str = None, status: int = None, gzip: bool = False,
+               case_id: int = None):
+        """
+        导出测试报告
+        :param report_id: 报告id
+        :param fmt: ndjson/csv/har
+        :param columns: 导出字段, 逗号分隔, har格式忽略该参数
+        :param status: 执行状态过滤
+        :param gzip: 是否gzip压缩
+        :param case_id: 用例id过滤
+        :return: 字节流, media_type, 文件名
+        """
+        if fmt not in ReportExporter.media_types:
+            raise Exception(f"不支持的导出格式: {fmt}")
+        if fmt == "har":
+            rows = ReportExporter.iter_results(report_id, ReportExporter.har_fields, status, case_id, False)
+            lines = ReportExporter.to_har(rows)
+        else:
+            fields = ReportExporter.parse_columns(columns)
+            rows = ReportExporter.iter_results(report_id, fields, status, case_id)
+            lines = ReportExporter.to_ndjson(rows) if fmt == "ndjson" else ReportExporter.to_csv(rows, fields)
+        filename = f"report_{report_id}.{fmt}"
+        if gzip:
+            return ReportExporter.encode(lines, True), "application/gzip", filename + ".gz"
+        return ReportExporter.encode(lines), ReportExporter.media_types[fmt], filename
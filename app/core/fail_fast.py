@@ -0,0 +1,56 @@
+"""
+测试计划快速失败策略
+
+计划执行过程中统计每条测试数据的执行结果, 一旦满足以下任一条件, 剩余未开始的用例全部跳过:
+1. 即使剩余用例全部通过, 通过率也无法达到测试计划的pass_rate
+2. 最近N条执行结果中失败/出错的比例超过阈值(环境大面积故障)
+"""
+from collections import deque
+
+from config import Config
+
+
+class FailFastGuard(object):
+
+    def __init__(self, total: int, pass_rate: int = 0, error_threshold: int = 0,
+                 window: int = Config.FAIL_FAST_WINDOW):
+        """
+        :param total: 本次执行的测试数据总数
+        :param pass_rate: 测试计划要求的通过率, 为0不检查
+        :param error_threshold: 滑动窗口内失败/出错比例阈值(百分比), 为0不检查
+        :param window: 滑动窗口大小
+        """
+        self.total = total
+        self.pass_rate = pass_rate or 0
+        self.error_threshold = error_threshold or 0
+        self.recent = deque(maxlen=window)
+        self.finished = 0
+        self.failed = 0
+        # 触发快速失败的原因, 为None说明继续执行
+        self.reason = None
+
+    @property
+    def stopped(self):
+        return self.reason is not None
+
+    def add(self, status: int):
+        """
+        记录一条执行结果并判断是否需要停止
+        :param status: 0: 成功 1: 失败 2: 出错
+        :return:
+        """
+        self.finished += 1
+        not_passed = status != 0
+        self.failed += not_passed
+        self.recent.append(not_passed)
+        if self.stopped or self.total == 0:
+            return
+        # 剩余用例全部成功时能达到的最高通过率
+        best = (self.total - self.failed) * 100 / self.total
+        if best < self.pass_rate:
+            self.reason = f"已失败{self.failed}/{self.total}条, 最高通过率{best:.2f}%无法达到{self.pass_rate}%"
+            return
+        if self.error_threshold and len(self.recent) == self.recent.maxlen:
+            rate = sum(self.recent) * 100 / len(self.recent)
+            if rate >= self.error_threshold:
+                self.reason = f"最近{len(self.recent)}条结果失败率{rate:.2f}%, 超过阈值{self.error_threshold}%"
@@ -0,0 +1,57 @@
+"""
+无序测试计划的执行顺序规划
+
+按历史耗时从长到短排列执行任务(LPT, Longest Processing Time first), 长耗时用例尽早开始,
+避免最后启动的几个慢用例拖长整个计划。同时按并发数模拟调度过程, 预测计划耗时
+"""
+import heapq
+import statistics
+from typing import List
+
+from app.crud.test_case.TestResult import TestResultDao
+
+
+class JobPlanner(object):
+
+    @staticmethod
+    async def estimate(env: int, case_list: List[int]) -> dict:
+        """
+        估算每个用例单条测试数据的耗时, 没有历史数据的用例使用已知用例耗时的中位数
+        :param env: 环境
+        :param case_list: 用例列表
+        :return: case_id -> 耗时(ms), 全部用例都没有历史数据时返回空dict
+        """
+        if not case_list:
+            return dict()
+        history = await TestResultDao.average_duration(env, *case_list)
+        if not history:
+            return dict()
+        median = statistics.median(history.values())
+        return {c: history.get(c, median) for c in case_list}
+
+    @staticmethod
+    def sort(jobs: list, estimate: dict) -> list:
+        """
+        按预估耗时倒序排列任务, 排序是稳定的, 没有历史数据时保持原有用例顺序
+        :param jobs: [(case_id, 测试数据)]
+        :param estimate: case_id -> 耗时
+        :return:
+        """
+        if not estimate:
+            return jobs
+        return sorted(jobs, key=lambda job: estimate.get(job[0], 0), reverse=True)
+
+    @staticmethod
+    def makespan(durations: List[float], concurrency: int) -> float:
+        """
+        按给定顺序模拟并发执行, 每个任务交给最先空闲的执行槽, 返回全部完成的时间
+        :param durations: 按执行顺序排列的任务耗时
+        :param concurrency: 并发数, 为空则不限制
+        :return:
+        """
+        if not durations:
+            return 0
+        slots = [0] * min(concurrency or len(durations), len(durations))
+        for d in durations:
+            heapq.heappush(slots, heapq.heappop(slots) + d)
+        return max(slots)
@@ -0,0 +1,169 @@
+"""
+redis key浏览器
+
+使用SCAN/SSCAN/HSCAN/ZSCAN分批遍历, 不会像KEYS一样阻塞redis。集群模式下依次遍历每个主节点,
+游标格式为"节点序号:节点游标", 游标为"0"表示遍历结束。大value按范围读取, 不会一次读出整个value
+"""
+from app.crud.config.RedisConfigDao import PityRedisConfigDao
+from app.utils.logger import Log
+from config import Config
+
+
+class RedisBrowser(object):
+    log = Log("RedisBrowser")
+    # 支持按范围读取的类型, set/hash需要通过scan_members分页遍历
+    range_types = ("string", "list", "zset")
+
+    @staticmethod
+    def get_count(count: int = None):
+        return min(count or Config.REDIS_SCAN_COUNT, Config.REDIS_SCAN_MAX_COUNT)
+
+    @staticmethod
+    def parse_cursor(cursor: str = None):
+        """
+        解析游标
+        :return: 节点序号, 节点游标
+        """
+        if not cursor or cursor == "0":
+            return 0, 0
+        try:
+            if ":" in cursor:
+                idx, cur = cursor.split(":", 1)
+                return int(idx), int(cur)
+            return 0, int(cursor)
+        except ValueError:
+            raise Exception(f"游标格式不正确: {cursor}")
+
+    @staticmethod
+    def scan_cursor(cursor):
+        # 集群客户端返回的是节点名 -> 游标
+        if isinstance(cursor, dict):
+            return int(next(iter(cursor.values()), 0))
+        return int(cursor)
+
+    @staticmethod
+    async def get_nodes(client, cluster: bool):
+        if not cluster:
+            return [None]
+        await client.initialize()
+        return sorted(client.get_primaries(), key=lambda n: n.name)
+
+    @staticmethod
+    async def scan_keys(redis_id: int, cursor: str = None, pattern: str = None, type: str = None, count: int = None):
+        """
+        分页遍历key, 一次最多调用REDIS_SCAN_MAX_CALLS次SCAN, 避免在匹配结果稀疏时长时间占用
+        :param redis_id: redis配置id
+        :param cursor: 上一页返回的游标, 第一页为空
+        :param pattern: MATCH匹配规则
+        :param type: key类型, 如string/list/set/zset/hash/stream
+        :param count: 每页数量
+        :return: keys: [dict(key, type, ttl)], cursor: 下一页游标, "0"表示遍历结束
+        """
+        try:
+            client, cluster = await PityRedisConfigDao.get_client(id=redis_id)
+            nodes = await RedisBrowser.get_nodes(client, cluster)
+            idx, cur = RedisBrowser.parse_cursor(cursor)
+            if idx >= len(nodes):
+                raise Exception("集群节点发生变化, 请重新遍历")
+            count = RedisBrowser.get_count(count)
+            keys = list()
+            for _ in range(Config.REDIS_SCAN_MAX_CALLS):
+                kwargs = dict(target_nodes=nodes[idx]) if cluster else dict()
+                cur, data = await client.scan(cur, match=pattern or None, count=count, _type=type or None, **kwargs)
+                cur = RedisBrowser.scan_cursor(cur)
+                keys.extend(data)
+                if cur == 0:
+                    # 当前节点遍历结束, 继续遍历下一个节点
+                    idx += 1
+                    if idx >= len(nodes):
+                        break
+                if len(keys) >= count:
+                    break
+            done = idx >= len(nodes)
+            return dict(keys=await RedisBrowser.describe(client, keys),
+                        cursor="0" if done else f"{idx}:{cur}")
+        except Exception as e:
+            RedisBrowser.log.error(f"遍历redis key失败, error: {e}")
+            raise Exception(f"遍历redis key失败: {e}")
+
+    @staticmethod
+    async def describe(client, keys: list):
+        """
+        通过pipeline批量获取key的类型和过期时间(ms)
+        """
+        if not keys:
+            return []
+        pipe = client.pipeline()
+        for k in keys:
+            pipe.type(k)
+            pipe.pttl(k)
+        data = await pipe.execute()
+        return [dict(key=k, type=data[2 * i], ttl=data[2 * i + 1]) for i, k in enumerate(keys)]
+
+    @staticmethod
+    async def scan_members(redis_id: int, key: str, cursor: str = None, pattern: str = None, count: int = None):
+        """
+        分页遍历set/hash/zset中的元素
+        :return: type: key类型, members: set为成员列表, hash为[field, value], zset为[member, score],
+                 cursor: 下一页游标
+        """
+        try:
+            client, _ = await PityRedisConfigDao.get_client(id=redis_id)
+            key_type = await client.type(key)
+            _, cur = RedisBrowser.parse_cursor(cursor)
+            count = RedisBrowser.get_count(count)
+            if key_type == "set":
+                cur, members = await client.sscan(key, cur, match=pattern or None, count=count)
+            elif key_type == "hash":
+                cur, data = await client.hscan(key, cur, match=pattern or None, count=count)
+                members = [[k, v] for k, v in data.items()]
+            elif key_type == "zset":
+                cur, data = await client.zscan(key, cur, match=pattern or None, count=count)
+                members = [[m, s] for m, s in data]
+            elif key_type == "none":
+                raise Exception("key不存在")
+            else:
+                raise Exception(f"{key_type}类型不支持遍历, 请按范围读取")
+            return dict(type=key_type, members=members, cursor=str(RedisBrowser.scan_cursor(cur)))
+        except Exception as e:
+            RedisBrowser.log.error(f"遍历redis key: {key}失败, error: {e}")
+            raise Exception(f"遍历redis key失败: {e}")
+
+    @staticmethod
+    async def get_value(redis_id: int, key: str, start: int = 0, end: int = None):
+        """
+        按范围读取value, string按字节, list/zset按下标
+        :param redis_id:
+        :param key:
+        :param start: 起始位置
+        :param end: 结束位置(包含), 为空则读取最大范围
+        :return: type: key类型, value: 读取到的数据, total: value总长度, ttl: 过期时间(ms)
+        """
+        try:
+            client, _ = await PityRedisConfigDao.get_client(id=redis_id)
+            key_type = await client.type(key)
+            if key_type == "none":
+                raise Exception("key不存在")
+            if key_type not in RedisBrowser.range_types:
+                raise Exception(f"{key_type}类型不支持按范围读取, 请分页遍历")
+            max_range = Config.REDIS_VALUE_MAX_BYTES if key_type == "string" else Config.REDIS_SCAN_MAX_COUNT
+            start = max(start or 0, 0)
+            end = start + max_range - 1 if end is None or end < 0 else min(end, start + max_range - 1)
+            pipe = client.pipeline()
+            if key_type == "string":
+                pipe.getrange(key, start, end)
+                pipe.strlen(key)
+            elif key_type == "list":
+                pipe.lrange(key, start, end)
+                pipe.llen(key)
+            else:
+                pipe.zrange(key, start, end, withscores=True)
+                pipe.zcard(key)
+            pipe.pttl(key)
+            value, total, ttl = await pipe.execute()
+            if key_type == "zset":
+                value = [[m, s] for m, s in value]
+            return dict(type=key_type, value=value, total=total, ttl=ttl, start=start, end=end)
+        except Exception as e:
+            RedisBrowser.log.error(f"读取redis key: {key}失败, error: {e}")
+            raise Exception(f"读取redis key失败: {e}")
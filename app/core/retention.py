@@ -0,0 +1,244 @@
+"""
+测试报告保留策略, 定时物理删除过期的报告和测试结果
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, or_, text
+
+from app.crud.config.RetentionDao import PityRetentionDao
+from app.crud.test_case.ResponseBlobDao import ResponseBlobDao
+from app.models import async_session
+from app.models.report import PityReport
+from app.models.result import PityTestResult
+from app.models.test_plan import PityTestPlan
+from app.utils.decorator import db_lock
+from app.utils.logger import Log
+from config import Config
+
+
+class RetentionPolicy(object):
+
+    def __init__(self, keep_runs=None, keep_days=None, keep_failed_days=None):
+        self.keep_runs = keep_runs
+        self.keep_days = keep_days
+        self.keep_failed_days = keep_failed_days
+
+    @property
+    def enabled(self):
+        """
+        没有配置保留次数和天数时不清理任何报告, 包括已软删除的报告
+        """
+        return bool(self.keep_runs or self.keep_days)
+
+    @staticmethod
+    def default():
+        return RetentionPolicy(Config.RETENTION_RUNS, Config.RETENTION_DAYS, Config.RETENTION_FAILED_DAYS)
+
+    def expired(self, report_id: int, start_at: datetime, failed: bool, threshold: int = None, now=None):
+        """
+        判断报告是否过期
+        :param report_id: 报告id
+        :param start_at: 报告开始时间
+        :param failed: 是否有失败/出错的用例
+        :param threshold: 超出最近N次执行的报告id上限, 小于等于它的报告都不在最近N次内
+        :param now:
+        :return:
+        """
+        age = (now or datetime.now()) - start_at
+        expired = bool(self.keep_days) and age > timedelta(days=self.keep_days)
+        if self.keep_runs and threshold is not None and report_id <= threshold:
+            expired = True
+        if expired and failed and self.keep_failed_days and age <= timedelta(days=self.keep_failed_days):
+            # 失败的报告保留更久
+            return False
+        return expired
+
+
+class ReportPurger(object):
+    log = Log("ReportPurger")
+
+    @staticmethod
+    async def load_policies():
+        """
+        获取所有保留策略
+        :return: plan_id -> 策略, project_id -> 策略, plan_id -> project_id
+        """
+        plan_policy, project_policy = dict(), dict()
+        for r in await PityRetentionDao.list_record():
+            policy = RetentionPolicy(r.keep_runs, r.keep_days, r.keep_failed_days)
+            if r.plan_id is None:
+                project_policy[r.project_id] = policy
+            else:
+                plan_policy[r.plan_id] = policy
+        async with async_session() as session:
+            # 已删除的测试计划也需要, 它们的报告同样需要清理
+            result = await session.execute(select(PityTestPlan.id, PityTestPlan.project_id))
+            plan_project = {plan_id: project_id for plan_id, project_id in result.all()}
+        return plan_policy, project_policy, plan_project
+
+    @staticmethod
+    async def get_thresholds(policy_of, plan_project: dict):
+        """
+        对配置了keep_runs的测试计划, 找出第N+1新的报告id
+        :return: plan_id -> 报告id
+        """
+        thresholds = dict()
+        async with async_session() as session:
+            for plan_id in [None, *plan_project.keys()]:
+                policy = policy_of(plan_id)
+                if not policy.keep_runs:
+                    continue
+                condition = PityReport.plan_id == None if plan_id is None else PityReport.plan_id == plan_id
+                result = await session.execute(select(PityReport.id).where(condition).order_by(
+                    PityReport.id.desc()).offset(policy.keep_runs).limit(1))
+                thresholds[plan_id] = result.scalar()
+        return thresholds
+
+    @staticmethod
+    @db_lock("report_purge")
+    async def purge():
+        """
+        按主键顺序分批扫描报告, 找出过期报告后分批删除测试结果和报告，避免长事务锁表
+        :return:
+        """
+        try:
+            plan_policy, project_policy, plan_project = await ReportPurger.load_policies()
+            default = RetentionPolicy.default()
+
+            def policy_of(plan_id):
+                if plan_id in plan_policy:
+                    return plan_policy[plan_id]
+                return project_policy.get(plan_project.get(plan_id), default)
+
+            if not any(p.enabled for p in [default, *plan_policy.values(), *project_policy.values()]):
+                return
+            thresholds = await ReportPurger.get_thresholds(policy_of, plan_project)
+            last, total, now = 0, 0, datetime.now()
+            while True:
+                async with async_session() as session:
+                    result = await session.execute(
+                        select(PityReport.id, PityReport.plan_id, PityReport.start_at, PityReport.failed_count,
+                               PityReport.error_count, PityReport.deleted_at)
+                            .where(PityReport.id > last,
+                                   or_(PityReport.finished_at != None, PityReport.deleted_at != None))
+                            .order_by(PityReport.id).limit(Config.PURGE_BATCH_SIZE))
+                    reports = result.all()
+                if not reports:
+                    break
+                last = reports[-1].id
+                expired = [r.id for r in reports if policy_of(r.plan_id).enabled and (
+                    r.deleted_at is not None or policy_of(r.plan_id).expired(
+                        r.id, r.start_at, r.failed_count + r.error_count > 0, thresholds.get(r.plan_id), now))]
+                if expired:
+                    await ReportPurger.delete_reports(expired)
+                    total += len(expired)
+            await ResultPartition.drop_expired(plan_policy, project_policy, default)
+            ReportPurger.log.info(f"清理过期报告完成, 共删除{total}份报告")
+        except Exception as e:
+            ReportPurger.log.error(f"清理过期报告失败: {str(e)}")
+
+    @staticmethod
+    async def delete_reports(report_ids: list):
+        """
+        分批删除报告对应的测试结果, 最后删除报告本身
+        :param report_ids:
+        :return:
+        """
+        while True:
+            async with async_session() as session:
+                async with session.begin():
+                    result = await session.execute(
+                        select(PityTestResult.id, PityTestResult.response_hash)
+                            .where(PityTestResult.report_id.in_(report_ids))
+                            .order_by(PityTestResult.id).limit(Config.PURGE_BATCH_SIZE))
+                    rows = result.all()
+                    if not rows:
+                        break
+                    await session.execute(delete(PityTestResult).where(
+                        PityTestResult.id.between(rows[0].id, rows[-1].id),
+                        PityTestResult.report_id.in_(report_ids)))
+                    await ResponseBlobDao.release(session, *(r.response_hash for r in rows))
+            # 让出事件循环, 同时给数据库喘息的时间
+            await asyncio.sleep(Config.PURGE_INTERVAL)
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(delete(PityReport).where(PityReport.id.in_(report_ids)))
+
+
+class ResultPartition(object):
+    """
+    pity_test_result按月分区(可选), 分区名为pYYYYMM, 过期月份直接drop分区
+
+    分区表需要手动转换一次, 分区键必须包含在主键中:
+        ALTER TABLE pity_test_result DROP PRIMARY KEY, ADD PRIMARY KEY (id, start_at);
+        ALTER TABLE pity_test_result PARTITION BY RANGE (TO_DAYS(start_at)) (
+            PARTITION p202610 VALUES LESS THAN (TO_DAYS('2026-11-01')),
+            PARTITION pmax VALUES LESS THAN MAXVALUE);
+    """
+    log = Log("ResultPartition")
+    table = PityTestResult.__tablename__
+
+    @staticmethod
+    def next_month(day: datetime):
+        return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+    @staticmethod
+    async def list_partitions(session):
+        result = await session.execute(text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL"),
+            dict(table=ResultPartition.table))
+        return [r[0] for r in result.all()]
+
+    @staticmethod
+    async def drop_expired(plan_policy: dict, project_policy: dict, default: RetentionPolicy):
+        """
+        所有策略都按天数保留时, 删除早于最长保留天数的分区, 并补齐下个月的分区
+        :return:
+        """
+        if not Config.RESULT_PARTITION:
+            return
+        policies = [default, *plan_policy.values(), *project_policy.values()]
+        if any(not p.keep_days for p in policies):
+            # 存在只按次数保留的策略, 不能按时间整体删除
+            return
+        days = max(max(p.keep_days, p.keep_failed_days or 0) for p in policies)
+        cutoff = datetime.now() - timedelta(days=days)
+        async with async_session() as session:
+            partitions = await ResultPartition.list_partitions(session)
+            for name in partitions:
+                if not name[1:].isdigit():
+                    continue
+                month = datetime.strptime(name[1:], "%Y%m")
+                # 分区内数据都早于下个月1号
+                if ResultPartition.next_month(month) <= cutoff:
+                    await session.execute(text(f"ALTER TABLE {ResultPartition.table} DROP PARTITION {name}"))
+                    ResultPartition.log.info(f"删除测试结果分区: {name}")
+            await ResultPartition.ensure(session, partitions)
+        # 删除分区不会更新response引用数, 需要清理孤立的response
+        last = ""
+        while last is not None:
+            async with async_session() as session:
+                async with session.begin():
+                    last = await ResponseBlobDao.collect_garbage(session, last, Config.PURGE_BATCH_SIZE)
+            await asyncio.sleep(Config.PURGE_INTERVAL)
+
+    @staticmethod
+    async def ensure(session, partitions: list):
+        """
+        从pmax中拆分出本月和下个月的分区
+        """
+        if "pmax" not in partitions:
+            return
+        current = ResultPartition.next_month(datetime.now()) - timedelta(days=1)
+        for month in (current, ResultPartition.next_month(current)):
+            name = month.strftime("p%Y%m")
+            if name in partitions:
+                continue
+            bound = ResultPartition.next_month(month).strftime("%Y-%m-%d")
+            await session.execute(text(
+                f"ALTER TABLE {ResultPartition.table} REORGANIZE PARTITION pmax INTO ("
+                f"PARTITION {name} VALUES LESS THAN (TO_DAYS('{bound}')), "
+                f"PARTITION pmax VALUES LESS THAN MAXVALUE)"))
+            ResultPartition.log.info(f"新增测试结果分区: {name}")
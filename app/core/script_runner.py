@@ -0,0 +1,178 @@
+"""
+python脚本执行器
+
+脚本在独立的进程池中执行, 不会占用web进程的GIL。每个脚本限制cpu时间、执行时间, 每个工作进程限制内存,
+编译后的代码按源码sha1缓存在工作进程中, 执行结果以json返回
+注意: 资源限制依赖resource/setitimer, 只在linux等unix系统上生效
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import signal
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from app.utils.logger import Log
+from config import Config
+
+# 工作进程内的代码缓存: 源码sha1 -> code
+_codes = OrderedDict()
+
+
+class ScriptTimeout(BaseException):
+    """
+    继承BaseException, 避免被脚本中的except Exception吞掉
+    """
+
+
+def _raise_timeout(signum, frame):
+    raise ScriptTimeout("cpu时间超限" if signum == getattr(signal, "SIGXCPU", None) else "执行超时")
+
+
+def _address_space():
+    """
+    当前进程已占用的虚拟内存(字节), 无法读取时返回0
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _init_worker(memory_limit: int):
+    """
+    工作进程初始化, 限制进程可使用的内存(MB)并注册超时信号
+    启动时已导入的模块占用的虚拟内存不计入限制, 在其基础上最多再使用memory_limit
+    """
+    if resource is not None and memory_limit:
+        limit = _address_space() + memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _raise_timeout)
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _raise_timeout)
+
+
+def _compile(source: str, sha: str):
+    code = _codes.get(sha)
+    if code is not None:
+        _codes.move_to_end(sha)
+        return code
+    code = compile(source, "<script>", "exec")
+    _codes[sha] = code
+    if len(_codes) > Config.SCRIPT_CODE_CACHE_SIZE:
+        _codes.popitem(last=False)
+    return code
+
+
+def _execute(source: str, sha: str, value: str, timeout: float, required: bool):
+    """
+    在工作进程中执行脚本
+    :param source: 脚本
+    :param sha: 脚本sha1
+    :param value: 需要返回的变量名
+    :param timeout: 执行时间和cpu时间限制(秒)
+    :param required: 变量必须存在, 为False时不存在返回null
+    :return: 变量值的json字符串
+    """
+    cpu_limit = None
+    if resource is not None:
+        # RLIMIT_CPU限制的是进程累计的cpu时间, 需要在已使用时间的基础上设置
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        cpu_limit = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (int(usage.ru_utime + usage.ru_stime + timeout) + 1, cpu_limit[1]))
+    if hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        loc = dict()
+        exec(_compile(source, sha), loc)
+        if required and value not in loc:
+            raise Exception(f"脚本中未定义变量: {value}")
+        return json.dumps(loc.get(value) if value else None, ensure_ascii=False, default=str)
+    except ScriptTimeout as e:
+        raise Exception(f"脚本{e}({timeout}s)")
+    except MemoryError:
+        raise Exception(f"脚本内存超限({Config.SCRIPT_MEMORY_LIMIT}MB)")
+    finally:
+        if hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if cpu_limit is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, cpu_limit)
+
+
+class ScriptRunner(object):
+    log = Log("ScriptRunner")
+    _pool = None
+    # 限制同时提交的脚本数与工作进程数一致, 避免排队时间计入超时
+    _semaphore = None
+
+    @staticmethod
+    def get_pool():
+        if ScriptRunner._pool is None:
+            # 使用spawn启动, 工作进程不会继承web进程的内存和连接
+            ScriptRunner._pool = ProcessPoolExecutor(max_workers=Config.SCRIPT_MAX_WORKERS,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_init_worker,
+                                                     initargs=(Config.SCRIPT_MEMORY_LIMIT,))
+        return ScriptRunner._pool
+
+    @staticmethod
+    def get_semaphore():
+        if ScriptRunner._semaphore is None:
+            ScriptRunner._semaphore = asyncio.Semaphore(Config.SCRIPT_MAX_WORKERS)
+        return ScriptRunner._semaphore
+
+    @staticmethod
+    def restart(pool: ProcessPoolExecutor):
+        """
+        工作进程卡死或异常退出时重建进程池, 只处理出问题的进程池, 避免重复重建时结束新进程池中的脚本
+        """
+        if pool is None or ScriptRunner._pool is not pool:
+            return
+        ScriptRunner._pool = None
+        # ProcessPoolExecutor没有提供强制结束工作进程的方法
+        for p in list((getattr(pool, "_processes", None) or dict()).values()):
+            p.terminate()
+        pool.shutdown(wait=False)
+
+    @staticmethod
+    async def run(source: str, value: str = None, timeout: int = None, required: bool = False):
+        """
+        执行python脚本
+        :param source: 脚本内容
+        :param value: 需要返回的变量名
+        :param timeout: 超时时间(ms), 为空则使用SCRIPT_TIMEOUT
+        :param required: 变量是否必须存在, 构造方法要求脚本中定义了返回的变量
+        :return: 变量的值
+        """
+        timeout = timeout / 1000 if timeout else Config.SCRIPT_TIMEOUT
+        sha = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        async with ScriptRunner.get_semaphore():
+            pool = ScriptRunner.get_pool()
+            start = time.time()
+            try:
+                future = asyncio.get_running_loop().run_in_executor(pool, _execute, source, sha, value, timeout,
+                                                                  required)
+                # 信号无法中断长时间运行的c代码, 超过宽限时间后直接结束工作进程
+                data = await asyncio.wait_for(future, timeout + Config.SCRIPT_TIMEOUT_GRACE)
+            except asyncio.TimeoutError:
+                ScriptRunner.log.error(f"脚本执行超时, 重建进程池, sha1: {sha}")
+                ScriptRunner.restart(pool)
+                raise Exception(f"脚本执行超时({timeout}s)")
+            except BrokenProcessPool:
+                if ScriptRunner._pool is not pool:
+                    # 进程池已被其他超时的脚本重建, 当前脚本被一并中断
+                    raise Exception("脚本执行进程池已重建, 当前脚本被中断, 请重试")
+                ScriptRunner.restart(pool)
+                raise Exception("脚本执行进程异常退出, 可能是内存超限")
+        ScriptRunner.log.debug(f"脚本执行完成, sha1: {sha}, 耗时: {round(time.time() - start, 3)}s")
+        return json.loads(data)
@@ -0,0 +1,186 @@
+"""
+在线SQL控制台
+
+查询语句使用服务端游标流式读取, 每页最多返回ONLINE_SQL_MAX_ROWS行/ONLINE_SQL_MAX_BYTES字节, 结果以列名+行数组的形式返回。
+翻页不依赖进程内状态: 客户端带上返回的offset重新提交sql, 服务端重新执行并跳过已读取的行, 多进程部署时任意进程都可以处理。
+没有order by的查询翻页时结果顺序可能不稳定。其他语句只执行一次, 不支持翻页
+"""
+import asyncio
+import json
+import re
+from datetime import datetime, date
+
+from sqlalchemy import text
+
+from app.middleware.RedisManager import RedisHelper
+from app.models import DatabaseHelper
+from app.utils.logger import Log
+from config import Config
+
+
+class SqlConsole(object):
+    log = Log("SqlConsole")
+    # 每次从游标读取的行数
+    batch_size = 200
+    # 使用服务端游标的语句, 其他语句(如update、show)直接执行
+    stream_pattern = re.compile(r"(select|with)\b", re.I)
+    # 语句开头的空白、注释和括号
+    prefix_pattern = re.compile(r"\s+|--[^\n]*|#[^\n]*|/\*.*?\*/|\(", re.S)
+    # 字符串常量、带引号的标识符和注释, 判断with语句是否只读前先去掉
+    literal_pattern = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|--[^\n]*|#[^\n]*|/\*.*?\*/", re.S)
+    # with语句中的写操作, 如postgres的with ... delete ... returning
+    write_pattern = re.compile(r"\b(insert|update|delete|merge)\b|\breplace\s+into\b", re.I)
+
+    @staticmethod
+    def serialize(value):
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        if isinstance(value, date):
+            return value.strftime("%Y-%m-%d")
+        if isinstance(value, (bytes, bytearray)):
+            return value.decode("utf-8", errors="replace")
+        return value
+
+    @staticmethod
+    def is_query(sql: str):
+        """
+        去掉开头的注释和括号后判断是否是查询语句, 翻页时会重新执行, 包含写操作的with语句不算查询
+        """
+        pos = 0
+        while True:
+            m = SqlConsole.prefix_pattern.match(sql, pos)
+            if m is None or m.end() == pos:
+                break
+            pos = m.end()
+        m = SqlConsole.stream_pattern.match(sql, pos)
+        if m is None:
+            return False
+        if m.group(1).lower() == "with":
+            return SqlConsole.write_pattern.search(SqlConsole.literal_pattern.sub(" ", sql)) is None
+        return True
+
+    @staticmethod
+    def statement(sql: str):
+        """
+        sql原样执行, 转义其中的冒号避免被当做绑定参数, %由sqlalchemy按驱动的参数风格转义
+        """
+        return text(sql.replace(":", "\\:"))
+
+    @staticmethod
+    def query_key(query_id: str):
+        return RedisHelper.get_key("sql_query:", query_id)
+
+    @staticmethod
+    async def register(query_id: str, database_id: int, backend_id: int, ttl: int):
+        """
+        记录查询id对应的数据源和服务端连接id, 存放在redis中, 任意进程都可以中断该查询
+        """
+        try:
+            await RedisHelper.pity_redis_client.set(SqlConsole.query_key(query_id),
+                                                    json.dumps(dict(database_id=database_id, backend_id=backend_id)),
+                                                    ex=ttl)
+        except Exception as e:
+            SqlConsole.log.error(f"记录查询: {query_id}失败, error: {e}")
+
+    @staticmethod
+    async def unregister(query_id: str):
+        if not query_id:
+            return
+        try:
+            await RedisHelper.pity_redis_client.delete(SqlConsole.query_key(query_id))
+        except Exception as e:
+            SqlConsole.log.error(f"删除查询: {query_id}记录失败, error: {e}")
+
+    @staticmethod
+    async def get_running(query_id: str):
+        """
+        获取正在执行的查询
+        :return: dict(database_id, backend_id)或None
+        """
+        data = await RedisHelper.pity_redis_client.get(SqlConsole.query_key(query_id))
+        return json.loads(data) if data else None
+
+    @staticmethod
+    async def execute(data: dict, sql: str, limit: int = None, timeout: int = None, query_id: str = None,
+                      database_id: int = None, offset: int = 0):
+        """
+        执行sql并读取一页数据
+        :param data: db_helper.get_connection的返回值
+        :param sql:
+        :param limit: 每页行数, 不能超过ONLINE_SQL_MAX_ROWS
+        :param timeout: 语句超时时间(ms)
+        :param query_id: 客户端生成的查询id, 可以通过它中断查询
+        :param database_id: 数据源id
+        :param offset: 跳过的行数, 即上一页返回的offset
+        :return: columns: 列名, rows: 行数组, truncated: 是否还有数据, offset: 读取下一页时传入的offset
+        """
+        if offset is not None and offset < 0:
+            raise Exception("offset不能小于0")
+        timeout = DatabaseHelper.get_timeout(timeout)
+        wait = timeout / 1000 + Config.DATASOURCE_TIMEOUT_GRACE
+        conn = await DatabaseHelper.acquire(data)
+        try:
+            backend_id = await DatabaseHelper.set_timeout(conn, data["sql_type"], timeout)
+            if query_id:
+                await SqlConsole.register(query_id, database_id, backend_id, int(wait) + 1)
+            if not SqlConsole.is_query(sql):
+                if offset:
+                    # 重新执行会重复写入数据, 也拿不到后面的行
+                    raise Exception("只有查询语句支持翻页")
+                return await SqlConsole.execute_directly(data, conn, sql, limit, wait, backend_id)
+            result = await DatabaseHelper.wait_for(data, conn, conn.stream(SqlConsole.statement(sql)), wait, backend_id)
+            try:
+                return await DatabaseHelper.wait_for(data, conn, SqlConsole.read(result, limit, offset or 0), wait,
+                                                     backend_id)
+            finally:
+                # 超时后连接已被丢弃, 游标不需要再关闭
+                if not conn.invalidated:
+                    await result.close()
+        except asyncio.TimeoutError:
+            raise Exception(f"执行sql超时({timeout}ms)")
+        finally:
+            await SqlConsole.unregister(query_id)
+            await conn.close()
+
+    @staticmethod
+    async def execute_directly(data: dict, conn, sql: str, limit: int, wait: float, backend_id: int = None):
+        """
+        非查询语句不使用服务端游标, 返回的行同样受行数限制, 超出的行直接丢弃, 不支持翻页
+        """
+        # exec_driver_sql会把sql当做格式化字符串, 含有%的语句会报错
+        result = await DatabaseHelper.wait_for(data, conn, conn.execute(SqlConsole.statement(sql)), wait, backend_id)
+        if not result.returns_rows:
+            # 说明是update或其他语句
+            await conn.commit()
+            return dict(columns=["rowCount"], rows=[[result.rowcount]], truncated=False, offset=1)
+        limit = min(limit or Config.ONLINE_SQL_MAX_ROWS, Config.ONLINE_SQL_MAX_ROWS)
+        rows = result.fetchmany(limit + 1)
+        rows = [[SqlConsole.serialize(v) for v in r] for r in result.fetchmany(limit)]
+        return dict(columns=list(result.keys()), rows=rows, truncated=False, offset=len(rows))
+
+    @staticmethod
+    async def read(result, limit: int = None, offset: int = 0):
+        """
+        跳过offset行后从游标读取一页数据, 多读一行用于判断是否还有数据
+        """
+        limit = min(limit or Config.ONLINE_SQL_MAX_ROWS, Config.ONLINE_SQL_MAX_ROWS)
+        skipped = 0
+        while skipped < offset:
+            batch = await result.fetchmany(min(SqlConsole.batch_size, offset - skipped))
+            if not batch:
+                break
+            skipped += len(batch)
+        rows, size, truncated = list(), 0, False
+        while not truncated:
+            batch = await result.fetchmany(min(SqlConsole.batch_size, limit + 1 - len(rows)))
+            if not batch:
+                break
+            for r in batch:
+                if len(rows) >= limit or size >= Config.ONLINE_SQL_MAX_BYTES:
+                    # 超出行数或字节限制, 剩余的行留到下一页
+                    truncated = True
+                    break
+                row = [SqlConsole.serialize(v) for v in r]
+                rows.append(row)
+                size += len(json.dumps(row, ensure_ascii=False, default=str))
+        return dict(columns=list(result.keys()), rows=rows, truncated=truncated, offset=skipped + len(rows))
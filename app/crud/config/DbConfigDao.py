@@ -1,17 +1,18 @@
+import asyncio
 import json
-from collections import defaultdict
 from datetime import datetime
-from typing import List
 
 from sqlalchemy import select, MetaData
-from sqlalchemy.exc import ResourceClosedError
 
+from app.core.sql_console import SqlConsole
 from app.crud.config.EnvironmentDao import EnvironmentDao
 from app.handler.fatcory import PityResponse
+from app.middleware.RedisManager import RedisHelper
 from app.models import async_session, DatabaseHelper, db_helper
 from app.models.database import PityDatabase
 from app.models.schema.database import DatabaseForm
 from app.utils.logger import Log
+from config import Config
 
 
 class DbConfigDao(object):
@@ -66,8 +67,10 @@ class DbConfigDao(object):
                     query = result.scalars().first()
                     if query is None:
                         raise Exception("数据库配置不存在")
-                    db_helper.remove_connection(query.host, query.port, query.username, query.password, query.database)
+                    await db_helper.remove_connection(query.sql_type, query.host, query.port, query.username,
+                                                      query.password, query.database)
                     DatabaseHelper.update_model(query, data, user)
+            await DbConfigDao.invalidate_schema(data.id)
         except Exception as e:
             DbConfigDao.log.error(f"编辑数据库配置: {data.name}失败, {e}")
             raise Exception("编辑数据库配置失败")
@@ -84,6 +87,9 @@ class DbConfigDao(object):
                         raise Exception("数据库配置不存在或已删除")
                     query.deleted_at = datetime.now()
                     query.update_user = user
+                    await db_helper.remove_connection(query.sql_type, query.host, query.port, query.username,
+                                                      query.password, query.database)
+            await DbConfigDao.invalidate_schema(id)
         except Exception as e:
             DbConfigDao.log.error(f"删除数据库配置: {id}失败, {e}")
             raise Exception("删除数据库配置失败")
@@ -112,9 +118,10 @@ class DbConfigDao(object):
             raise Exception("获取数据库配置失败")
 
     @staticmethod
-    async def query_database_and_tables():
+    async def query_database_and_tables(refresh: bool = False):
         """
-        方法会查询所有数据库表配置的信息
+        方法会查询所有数据库表配置的信息, 表结构优先从缓存读取, 未缓存的数据库并发反射
+        :param refresh: 是否忽略缓存重新反射全部数据库
         :return:
         """
         try:
@@ -124,88 +131,200 @@ class DbConfigDao(object):
             env_data, _, _ = EnvironmentDao.list_env(1, 1, exactly=True)
             env_map = {env.id: env.name for env in env_data}
             # 获取数据库相关的信息
-            table_map = defaultdict(set)
+            table_map = dict()
             async with async_session() as session:
                 query = await session.execute(select(PityDatabase).where(PityDatabase.deleted_at == None))
                 data = query.scalars().all()
-                for d in data:
-                    name = env_map[d.env]
-                    idx = env_index.get(name)
-                    if idx is None:
-                        result.append(dict(title=name, key=f"env_{name}", children=list()))
-                        idx = len(result) - 1
-                        env_index[name] = idx
-                    DbConfigDao.get_tables(table_map, d, result[idx]['children'])
-                return result, table_map
+            semaphore = asyncio.Semaphore(Config.SCHEMA_REFLECT_CONCURRENCY)
+            schemas = await asyncio.gather(*(DbConfigDao.get_schema(d, semaphore, refresh) for d in data))
+            for d, (node, tables) in zip(data, schemas):
+                name = env_map[d.env]
+                idx = env_index.get(name)
+                if idx is None:
+                    result.append(dict(title=name, key=f"env_{name}", children=list()))
+                    idx = len(result) - 1
+                    env_index[name] = idx
+                result[idx]['children'].append(node)
+                table_map[d.id] = tables
+            return result, table_map
         except Exception as err:
             DbConfigDao.log.error(f"获取数据库配置详情失败, error: {err}")
             raise Exception(f"获取数据库配置详情失败: {err}")
 
     @staticmethod
-    def get_tables(table_map: dict, data: PityDatabase, children: List):
+    def schema_key(id: int):
+        return RedisHelper.get_key("schema:", id)
+
+    @staticmethod
+    async def invalidate_schema(*id: int):
+        """
+        清除数据库表结构缓存
+        """
+        try:
+            if id:
+                await RedisHelper.pity_redis_client.delete(*(DbConfigDao.schema_key(x) for x in id))
+        except Exception as e:
+            DbConfigDao.log.error(f"清除数据库表结构缓存失败, error: {e}")
+
+    @staticmethod
+    async def get_schema(data: PityDatabase, semaphore: asyncio.Semaphore = None, refresh: bool = False):
+        """
+        获取数据库的表结构, 优先读取缓存, 反射失败或超时的数据库返回错误节点且不缓存
+        :param data: 数据库配置
+        :param semaphore: 限制同时反射的数量
+        :param refresh: 是否忽略缓存
+        :return: 树节点, 表名及字段名列表
+        """
+        key = DbConfigDao.schema_key(data.id)
+        if not refresh:
+            try:
+                cache = await RedisHelper.pity_redis_client.get(key)
+                if cache is not None:
+                    return json.loads(cache)
+            except Exception as e:
+                DbConfigDao.log.error(f"读取数据库表结构缓存失败, error: {e}")
+        try:
+            if semaphore is None:
+                ans = await asyncio.wait_for(DbConfigDao.get_tables(data), Config.SCHEMA_REFLECT_TIMEOUT)
+            else:
+                async with semaphore:
+                    ans = await asyncio.wait_for(DbConfigDao.get_tables(data), Config.SCHEMA_REFLECT_TIMEOUT)
+        except Exception as e:
+            err = f"反射超时({Config.SCHEMA_REFLECT_TIMEOUT}s)" if isinstance(e, asyncio.TimeoutError) else str(e)
+            DbConfigDao.log.error(f"获取数据库: {data.name}表结构失败, error: {err}")
+            return dict(title=f"{data.database}（{data.host}:{data.port}）", key=f"database_{data.id}",
+                        children=list(), sql_type=data.sql_type, error=err), list()
+        try:
+            await RedisHelper.pity_redis_client.set(key, json.dumps(ans, ensure_ascii=False),
+                                                    ex=Config.SCHEMA_CACHE_TTL)
+        except Exception as e:
+            DbConfigDao.log.error(f"写入数据库表结构缓存失败, error: {e}")
+        return ans
+
+    @staticmethod
+    async def refresh_schema(id: int):
+        """
+        重新反射单个数据库的表结构
+        :param id: 数据库配置id
+        :return: 树节点, 表名及字段名列表
+        """
+        query = await DbConfigDao.query_database(id)
+        if query is None:
+            raise Exception("未找到对应的数据库配置")
+        return await DbConfigDao.get_schema(query, refresh=True)
+
+    @staticmethod
+    async def get_tables(data: PityDatabase):
         conn = db_helper.get_connection(data.sql_type, data.host, data.port, data.username, data.password,
                                         data.database)
+        if conn is None:
+            raise Exception("暂不支持的数据库类型")
         database_child = list()
         dbs = dict(title=f"{data.database}（{data.host}:{data.port}）", key=f"database_{data.id}",
                    children=database_child, sql_type=data.sql_type)
-        eng = conn.get('engine')
+        tables = set()
         meta = MetaData()
-        meta.reflect(bind=eng)
+        async with db_helper.connect(conn) as c:
+            # 反射只支持同步连接
+            await c.run_sync(meta.reflect)
         for t in meta.sorted_tables:
-            table_map[data.id].add(str(t))
+            tables.add(str(t))
             temp = []
             database_child.append(dict(title=str(t), key=f"table_{data.id}_{t}", children=temp))
             for k, v in t.c.items():
-                table_map[data.id].add(k)
+                tables.add(k)
                 temp.append(dict(
                     title=k,
                     primary_key=v.primary_key,
-                    type={str(v.type)},
+                    type=[str(v.type)],
                     key=f"column_{t}_{data.id}_{k}",
                 ))
-        children.append(dbs)
+        return dbs, sorted(tables)
 
     @staticmethod
-    async def online_sql(id: int, sql: str):
+    async def online_sql(id: int, sql: str, limit: int = None, query_id: str = None, offset: int = 0):
         try:
             query = await DbConfigDao.query_database(id)
             if query is None:
                 raise Exception("未找到对应的数据库配置")
             data = db_helper.get_connection(query.sql_type, query.host, query.port, query.username, query.password,
                                             query.database)
-            return await DbConfigDao.execute(data, sql)
+            if data is None:
+                raise Exception("暂不支持的数据库类型")
+            return await SqlConsole.execute(data, sql, limit, query.timeout, query_id, query.id, offset)
         except Exception as e:
             DbConfigDao.log.error(f"查询数据库配置失败, error: {e}")
             raise Exception(f"执行SQL失败: {e}")
 
     @staticmethod
-    async def execute(conn, sql):
-        row_count = 0
+    async def execute(conn, sql, timeout: int = None):
+        """
+        使用数据源的异步连接池执行sql, 不解析其中的:参数
+        :param conn: db_helper.get_connection的返回值
+        :param sql:
+        :param timeout: 语句超时时间(ms), 为空使用默认值
+        :return:
+        """
+        timeout = DatabaseHelper.get_timeout(timeout)
         try:
-            session = conn.get("session")
-            with session() as s:
-                result = s.execute(sql)
-                row_count = result.rowcount
-                ans = result.mappings().all()
-                return ans
-        except ResourceClosedError:
-            # 说明是update或其他语句
-            return [{"rowCount": row_count}]
+            async with db_helper.connect(conn) as c:
+                backend_id = await DatabaseHelper.set_timeout(c, conn["sql_type"], timeout)
+                result = await DatabaseHelper.wait_for(conn, c, c.execute(SqlConsole.statement(sql)),
+                                                       timeout / 1000 + Config.DATASOURCE_TIMEOUT_GRACE, backend_id)
+                if not result.returns_rows:
+                    # 说明是update或其他语句
+                    await c.commit()
+                    return [{"rowCount": result.rowcount}]
+                return result.mappings().all()
+        except asyncio.TimeoutError:
+            DbConfigDao.log.error(f"执行sql超时: {sql}")
+            raise Exception(f"执行sql超时({timeout}ms)")
         except Exception as e:
             DbConfigDao.log.error(f"查询数据库配置失败, error: {e}")
             raise e
 
     @staticmethod
-    async def execute_sql(env: int, name: str, sql: str):
+    async def execute_sql(env: int, name: str, sql: str, timeout: int = None):
+        """
+        sql构造方法执行sql
+        :param env: 环境
+        :param name: 数据库名称
+        :param sql:
+        :param timeout: 构造方法的超时时间(ms), 为空则使用数据源配置
+        :return:
+        """
         try:
             query = await DbConfigDao.query_database_by_env_and_name(env, name)
             if query is None:
                 raise Exception("未找到对应的数据库配置")
             data = db_helper.get_connection(query.sql_type, query.host, query.port, query.username, query.password,
                                             query.database)
-            result = await DbConfigDao.execute(data, sql)
+            result = await DbConfigDao.execute(data, sql, timeout or query.timeout)
             _, result = PityResponse.parse_sql_result(result)
             return json.dumps(result, ensure_ascii=False)
         except Exception as e:
             DbConfigDao.log.error(f"查询数据库配置失败, error: {e}")
             raise Exception(f"执行SQL失败: {e}")
+
+    @staticmethod
+    async def kill_query(query_id: str):
+        """
+        中断在线sql中正在执行的查询
+        :param query_id: 执行sql时客户端传入的查询id
+        :return:
+        """
+        try:
+            running = await SqlConsole.get_running(query_id)
+            if running is None:
+                raise Exception("查询不存在或已结束")
+            query = await DbConfigDao.query_database(running["database_id"])
+            if query is None:
+                raise Exception("未找到对应的数据库配置")
+            data = db_helper.get_connection(query.sql_type, query.host, query.port, query.username, query.password,
+                                            query.database)
+            async with db_helper.connect(data) as c:
+                await DatabaseHelper.cancel(c, query.sql_type, running["backend_id"])
+            await SqlConsole.unregister(query_id)
+        except Exception as e:
+            DbConfigDao.log.error(f"中断查询: {query_id}失败, error: {e}")
+            raise Exception(f"中断查询失败: {e}")
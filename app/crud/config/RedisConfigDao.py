@@ -1,3 +1,5 @@
+import shlex
+
 from app.crud import Mapper
 from app.middleware.RedisManager import PityRedisManager, RedisHelper
 from app.models.redis_config import PityRedis
@@ -8,19 +10,62 @@ from app.utils.logger import Log
 @dao(PityRedis, Log("PityRedisConfigDao"))
 class PityRedisConfigDao(Mapper):
 
+    @staticmethod
+    async def get_client(**kwargs):
+        """
+        根据redis配置获取客户端
+        :return: 客户端, 是否是集群
+        """
+        redis_config = await PityRedisConfigDao.query_record(**kwargs)
+        if redis_config is None:
+            raise Exception("Redis配置不存在")
+        if not redis_config.cluster:
+            return PityRedisManager.get_single_node_client(redis_config.id, redis_config.addr,
+                                                           redis_config.password, redis_config.db), False
+        return PityRedisManager.get_cluster_client(redis_config.id, redis_config.addr), True
+
     @staticmethod
     async def execute_command(command: str, **kwargs):
         try:
-            redis_config = await PityRedisConfigDao.query_record(**kwargs)
-            if redis_config is None:
-                raise Exception("Redis配置不存在")
-            if not redis_config.cluster:
-                client = PityRedisManager.get_single_node_client(redis_config.id, redis_config.addr,
-                                                                 redis_config.password, redis_config.db)
-            else:
-                client = PityRedisManager.get_cluster_client(redis_config.id, redis_config.addr)
-            return RedisHelper.execute_command(client, command)
+            client, _ = await PityRedisConfigDao.get_client(**kwargs)
+            # 按shell规则拆分命令, 集群模式需要根据参数中的key路由到对应节点
+            return await RedisHelper.execute_command(client, *shlex.split(command))
+        except Exception as e:
+            raise Exception(f"执行redis命令出错: {e}")
+
+    @staticmethod
+    async def execute_pipeline(commands: list, transaction: bool = False, **kwargs):
+        """
+        通过pipeline一次性发送多条命令
+        :param commands: 命令列表
+        :param transaction: 是否使用MULTI/EXEC包裹, 集群模式不支持
+        :return: 每条命令的返回值
+        """
+        try:
+            client, cluster = await PityRedisConfigDao.get_client(**kwargs)
+            if cluster and transaction:
+                raise Exception("集群模式不支持事务")
+            pipe = client.pipeline(transaction=transaction or None)
+            for command in commands:
+                pipe.execute_command(*shlex.split(command))
+            return await pipe.execute()
         except Exception as e:
             raise Exception(f"执行redis命令出错: {e}")
 
+    @staticmethod
+    async def execute_script(script: str, keys: list = None, args: list = None, **kwargs):
+        """
+        执行lua脚本, 使用EVALSHA避免每次传输脚本内容
+        :param script: lua脚本
+        :param keys: KEYS
+        :param args: ARGV
+        :return:
+        """
+        try:
+            client, _ = await PityRedisConfigDao.get_client(**kwargs)
+            lua = PityRedisManager.get_script(client, script)
+            return await lua(keys=keys or [], args=args or [], client=client)
+        except Exception as e:
+            raise Exception(f"执行redis脚本出错: {e}")
+
 
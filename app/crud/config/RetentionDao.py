@@ -0,0 +1,9 @@
+from app.crud import Mapper
+from app.models.retention import PityRetention
+from app.utils.decorator import dao
+from app.utils.logger import Log
+
+
+@dao(PityRetention, Log("PityRetentionDao"))
+class PityRetentionDao(Mapper):
+    pass
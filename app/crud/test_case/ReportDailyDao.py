@@ -0,0 +1,176 @@
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.mysql import insert
+
+from app.handler.fatcory import PityResponse
+from app.models import async_session
+from app.models.report import PityReport
+from app.models.report_daily import PityReportDaily
+from app.models.result import PityTestResult
+from app.models.test_plan import PityTestPlan
+from app.utils.logger import Log
+from config import Config
+
+
+class ReportDailyDao(object):
+    log = Log("ReportDailyDao")
+    # 可累加的统计字段
+    sum_fields = ["report_count", "case_count", "success_count", "failed_count", "error_count", "skipped_count",
+                  "cost_sum", "duration_sum", "duration_count"]
+    max_fields = ["cost_max", "duration_max"]
+
+    @staticmethod
+    def cost_ms(cost: str):
+        """
+        报告耗时是以秒为单位的字符串
+        """
+        try:
+            return round(float(cost) * 1000)
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    async def aggregate(session, reports: list):
+        """
+        将一批已完成的报告汇总为按天统计的数据
+        :param session:
+        :param reports: 报告列表
+        :return: (project_id, plan_id, env, day) -> 统计数据
+        """
+        plan_ids = {r.plan_id for r in reports if r.plan_id}
+        plan_project = dict()
+        if plan_ids:
+            result = await session.execute(select(PityTestPlan.id, PityTestPlan.project_id)
+                                           .where(PityTestPlan.id.in_(plan_ids)))
+            plan_project = dict(result.all())
+        result = await session.execute(
+            select(PityTestResult.report_id, func.sum(PityTestResult.duration), func.count(PityTestResult.duration),
+                   func.max(PityTestResult.duration))
+                .where(PityTestResult.report_id.in_([r.id for r in reports]))
+                .group_by(PityTestResult.report_id))
+        durations = {report_id: (int(s or 0), c, m or 0) for report_id, s, c, m in result.all()}
+        ans = defaultdict(lambda: dict.fromkeys(ReportDailyDao.sum_fields + ReportDailyDao.max_fields, 0))
+        for r in reports:
+            plan_id = r.plan_id or 0
+            key = (plan_project.get(plan_id, 0), plan_id, r.env, r.start_at.date())
+            cost = ReportDailyDao.cost_ms(r.cost)
+            duration_sum, duration_count, duration_max = durations.get(r.id, (0, 0, 0))
+            data = ans[key]
+            data["report_count"] += 1
+            data["case_count"] += r.success_count + r.failed_count + r.error_count + r.skipped_count
+            data["success_count"] += r.success_count
+            data["failed_count"] += r.failed_count
+            data["error_count"] += r.error_count
+            data["skipped_count"] += r.skipped_count
+            data["cost_sum"] += cost
+            data["cost_max"] = max(data["cost_max"], cost)
+            data["duration_sum"] += duration_sum
+            data["duration_count"] += duration_count
+            data["duration_max"] = max(data["duration_max"], duration_max)
+        return ans
+
+    @staticmethod
+    async def accumulate(session, reports: list):
+        """
+        把报告累加到按天汇总表中
+        :param session:
+        :param reports:
+        :return:
+        """
+        if not reports:
+            return
+        data = await ReportDailyDao.aggregate(session, reports)
+        now = datetime.now()
+        for (project_id, plan_id, env, day), values in data.items():
+            sql = insert(PityReportDaily).values(project_id=project_id, plan_id=plan_id, env=env, day=day,
+                                                 updated_at=now, **values)
+            update = {f: getattr(PityReportDaily, f) + sql.inserted[f] for f in ReportDailyDao.sum_fields}
+            update.update({f: func.greatest(getattr(PityReportDaily, f), sql.inserted[f])
+                           for f in ReportDailyDao.max_fields})
+            await session.execute(sql.on_duplicate_key_update(updated_at=now, **update))
+
+    @staticmethod
+    async def add_report(report: PityReport):
+        """
+        报告执行完成后调用, 增量更新当天的汇总数据
+        :param report:
+        :return:
+        """
+        try:
+            async with async_session() as session:
+                async with session.begin():
+                    await ReportDailyDao.accumulate(session, [report])
+        except Exception as e:
+            ReportDailyDao.log.error(f"更新报告日汇总数据失败, error: {e}")
+            raise Exception(f"更新报告日汇总数据失败: {e}")
+
+    @staticmethod
+    async def backfill(start_date: date, end_date: date):
+        """
+        根据历史报告重新生成日期范围内的汇总数据, 已有数据会先被清空
+        :param start_date: 开始日期
+        :param end_date: 结束日期(包含)
+        :return: 处理的报告数量
+        """
+        try:
+            start, end = datetime.combine(start_date, datetime.min.time()), \
+                         datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+            async with async_session() as session:
+                async with session.begin():
+                    await session.execute(delete(PityReportDaily).where(
+                        PityReportDaily.day.between(start_date, end_date)))
+            last, total = 0, 0
+            while True:
+                async with async_session() as session:
+                    async with session.begin():
+                        result = await session.execute(
+                            select(PityReport).where(PityReport.id > last, PityReport.start_at >= start,
+                                                     PityReport.start_at < end, PityReport.finished_at != None,
+                                                     PityReport.deleted_at == None)
+                                .order_by(PityReport.id).limit(Config.PURGE_BATCH_SIZE))
+                        reports = result.scalars().all()
+                        if not reports:
+                            break
+                        await ReportDailyDao.accumulate(session, reports)
+                        last = reports[-1].id
+                        total += len(reports)
+            return total
+        except Exception as e:
+            ReportDailyDao.log.error(f"回填报告日汇总数据失败, error: {e}")
+            raise Exception(f"回填报告日汇总数据失败: {e}")
+
+    @staticmethod
+    async def list_daily(start_date: str, end_date: str, project_id: int = None, plan_id: int = None,
+                         env: int = None):
+        """
+        获取日期范围内的汇总数据, 按日期升序
+        :param start_date:
+        :param end_date:
+        :param project_id:
+        :param plan_id:
+        :param env:
+        :return:
+        """
+        try:
+            async with async_session() as session:
+                conditions = [PityReportDaily.day.between(start_date, end_date)]
+                if project_id is not None:
+                    conditions.append(PityReportDaily.project_id == project_id)
+                if plan_id is not None:
+                    conditions.append(PityReportDaily.plan_id == plan_id)
+                if env is not None:
+                    conditions.append(PityReportDaily.env == env)
+                result = await session.execute(select(PityReportDaily).where(*conditions)
+                                               .order_by(PityReportDaily.day, PityReportDaily.id))
+                ans = PityResponse.model_to_list(result.scalars().all())
+                for x in ans:
+                    x["pass_rate"] = round(x["success_count"] / x["case_count"] * 100, 2) if x["case_count"] else 0
+                    x["cost_avg"] = round(x["cost_sum"] / x["report_count"]) if x["report_count"] else 0
+                    x["duration_avg"] = round(x["duration_sum"] / x["duration_count"]) \
+                        if x["duration_count"] else 0
+                return ans
+        except Exception as e:
+            ReportDailyDao.log.error(f"获取报告日汇总数据失败, error: {e}")
+            raise Exception(f"获取报告日汇总数据失败: {e}")
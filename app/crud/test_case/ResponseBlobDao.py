@@ -0,0 +1,94 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, exists
+from sqlalchemy.dialects.mysql import insert
+
+from app.models.response_blob import PityResponseBlob
+from app.models.result import PityTestResult
+from app.utils.compressor import TextCompressor
+from app.utils.logger import Log
+from config import Config
+
+
+class ResponseBlobDao(object):
+    """
+    response按内容寻址存储, 方法都需要传入session, 与测试结果的读写处于同一个事务
+    不维护引用数, 避免相同response的测试结果并发写入时争抢同一行, 没有被引用的内容通过反连接查找后清理
+    """
+    log = Log("ResponseBlobDao")
+
+    @staticmethod
+    def get_hash(content: str):
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    async def store(session, content: str) -> str:
+        """
+        保存response, 已存在则忽略
+        :param session:
+        :param content:
+        :return: 内容hash
+        """
+        content_hash = ResponseBlobDao.get_hash(content)
+        sql = insert(PityResponseBlob).prefix_with("IGNORE").values(
+            hash=content_hash, content=TextCompressor.compress(content), size=len(content), created_at=datetime.now())
+        await session.execute(sql)
+        return content_hash
+
+    @staticmethod
+    async def query(session, *content_hash: str) -> dict:
+        """
+        批量获取response内容
+        :param session:
+        :param content_hash:
+        :return: hash -> 解压后的内容
+        """
+        hashes = {h for h in content_hash if h}
+        if not hashes:
+            return dict()
+        result = await session.execute(select(PityResponseBlob.hash, PityResponseBlob.content).where(
+            PityResponseBlob.hash.in_(hashes)))
+        return {h: TextCompressor.decompress(c) for h, c in result.all()}
+
+    @staticmethod
+    def collectable():
+        """
+        可以清理的内容: 超过保护时间且没有被测试结果引用
+        保护时间内的内容可能刚被写入, 引用它的测试结果还未提交
+        """
+        cutoff = datetime.now() - timedelta(minutes=Config.RESPONSE_BLOB_GC_GRACE)
+        return [PityResponseBlob.created_at < cutoff,
+                ~exists().where(PityTestResult.response_hash == PityResponseBlob.hash)]
+
+    @staticmethod
+    async def release(session, *content_hash: str):
+        """
+        测试结果被物理删除后, 清理其中不再被任何测试结果引用的内容
+        :param session:
+        :param content_hash: 被删除的测试结果引用的hash
+        :return:
+        """
+        hashes = {h for h in content_hash if h}
+        if hashes:
+            await session.execute(delete(PityResponseBlob).where(
+                PityResponseBlob.hash.in_(hashes), *ResponseBlobDao.collectable()))
+
+    @staticmethod
+    async def collect_garbage(session, last_hash: str = "", size: int = 500):
+        """
+        清理没有被任何测试结果引用的内容(如按分区直接删除测试结果后), 每次处理一批
+        :param session:
+        :param last_hash: 上一批最后一个hash
+        :param size: 每批数量
+        :return: 本批最后一个hash, 没有数据时返回None
+        """
+        result = await session.execute(select(PityResponseBlob.hash).where(
+            PityResponseBlob.hash > last_hash).order_by(PityResponseBlob.hash).limit(size))
+        hashes = result.scalars().all()
+        if not hashes:
+            return None
+        # 删除时再次检查引用, 避免清理期间被新的测试结果引用
+        await session.execute(delete(PityResponseBlob).where(
+            PityResponseBlob.hash.in_(hashes), *ResponseBlobDao.collectable()))
+        return hashes[-1]
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from sqlalchemy import asc, select
 
 from app.models import Session, async_session, DatabaseHelper
@@ -32,6 +34,50 @@ class TestCaseAssertsDao(object):
             TestCaseAssertsDao.log.error(f"获取用例断言失败: {str(e)}")
             return [], f"获取用例断言失败: {str(e)}"
 
+    @staticmethod
+    def list_test_case_asserts_by_case_ids(*case_id: int):
+        """
+        批量获取多个用例的断言, 避免逐个用例查询
+        :param case_id:
+        :return: case_id -> 断言列表
+        """
+        try:
+            ans = defaultdict(list)
+            if not case_id:
+                return ans, None
+            with Session() as session:
+                data = session.query(TestCaseAsserts).filter(TestCaseAsserts.case_id.in_(case_id),
+                                                             TestCaseAsserts.deleted_at == None).order_by(
+                    asc(TestCaseAsserts.name)).all()
+                for d in data:
+                    ans[d.case_id].append(d)
+                return ans, None
+        except Exception as e:
+            TestCaseAssertsDao.log.error(f"批量获取用例断言失败: {str(e)}")
+            return defaultdict(list), f"批量获取用例断言失败: {str(e)}"
+
+    @staticmethod
+    async def async_list_test_case_asserts_by_case_ids(*case_id: int):
+        """
+        异步批量获取多个用例的断言
+        :param case_id:
+        :return: case_id -> 断言列表
+        """
+        try:
+            ans = defaultdict(list)
+            if not case_id:
+                return ans, None
+            async with async_session() as session:
+                sql = select(TestCaseAsserts).where(TestCaseAsserts.case_id.in_(case_id),
+                                                    TestCaseAsserts.deleted_at == None).order_by(TestCaseAsserts.name)
+                result = await session.execute(sql)
+                for d in result.scalars().all():
+                    ans[d.case_id].append(d)
+                return ans, None
+        except Exception as e:
+            TestCaseAssertsDao.log.error(f"批量获取用例断言失败: {str(e)}")
+            return defaultdict(list), f"批量获取用例断言失败: {str(e)}"
+
     @staticmethod
     async def insert_test_case_asserts(form: TestCaseAssertsForm, user: int):
         try:
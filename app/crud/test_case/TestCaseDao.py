@@ -13,7 +13,10 @@ from app.models import Session, DatabaseHelper, async_session
 from app.models.constructor import Constructor
 from app.models.schema.testcase_schema import TestCaseForm
 from app.models.test_case import TestCase
+from app.models.testcase_directory import PityTestcaseDirectory
 from app.utils.logger import Log
+from app.utils.tree_cache import ProjectTreeCache
+from config import Config
 
 
 class TestCaseDao(object):
@@ -61,28 +64,34 @@ class TestCaseDao(object):
         # 获取目录->用例的映射关系
         for cs in case_list:
             result[cs.catalogue].append(cs)
-
+        # 一次性查出所有用例的断言，不再逐个用例查询
+        asserts, err = TestCaseAssertsDao.list_test_case_asserts_by_case_ids(*(cs.id for cs in case_list))
+        if err:
+            raise Exception(err)
         keys = sorted(result.keys())
         tree = [dict(key=f"cat_{key}",
                      children=[{"key": f"case_{child.id}", "title": child.name,
-                                "total": TestCaseDao.get_case_children_length(child.id),
-                                "children": TestCaseDao.get_case_children(child.id)} for child in result[key]],
+                                "total": len(asserts[child.id]),
+                                "children": TestCaseDao.get_case_children(child.id, asserts[child.id])}
+                               for child in result[key]],
                      title=key, total=len(result[key])) for key in keys]
         return tree
 
     @staticmethod
-    def get_case_children(case_id: int):
-        data, err = TestCaseAssertsDao.list_test_case_asserts(case_id)
-        if err:
-            raise err
+    def get_case_children(case_id: int, data: List):
         return [dict(key=f"asserts_{d.id}", title=d.name, case_id=case_id) for d in data]
 
     @staticmethod
-    def get_case_children_length(case_id: int):
-        data, err = TestCaseAssertsDao.list_test_case_asserts(case_id)
-        if err:
-            raise err
-        return len(data)
+    def get_project_id(session, *directory_id: int):
+        """
+        根据目录id获取所属项目id
+        :param session:
+        :param directory_id:
+        :return:
+        """
+        data = session.query(PityTestcaseDirectory.project_id).filter(
+            PityTestcaseDirectory.id.in_(directory_id)).all()
+        return [d.project_id for d in data]
 
     @staticmethod
     def insert_test_case(test_case, user):
@@ -103,6 +112,7 @@ class TestCaseDao(object):
                 session.add(cs)
                 session.commit()
                 session.refresh(cs)
+                ProjectTreeCache.bump(*TestCaseDao.get_project_id(session, cs.directory_id))
                 return cs.id
         except Exception as e:
             TestCaseDao.log.error(f"添加用例失败: {str(e)}")
@@ -121,9 +131,12 @@ class TestCaseDao(object):
                 data = session.query(TestCase).filter_by(id=test_case.id, deleted_at=None).first()
                 if data is None:
                     raise Exception("用例不存在")
+                # 用例可能被移动到其他目录，新旧目录所属项目的用例树都需要失效
+                directories = {data.directory_id, test_case.directory_id}
                 DatabaseHelper.update_model(data, test_case, user)
                 session.commit()
                 session.refresh(data)
+                ProjectTreeCache.bump(*TestCaseDao.get_project_id(session, *directories))
                 return data
         except Exception as e:
             TestCaseDao.log.error(f"编辑用例失败: {str(e)}")
@@ -240,33 +253,92 @@ class TestCaseDao(object):
             TestCaseDao.log.error(f"查询构造数据失败: {str(e)}")
 
     @staticmethod
-    async def collect_data(case_id: int, data: List):
+    async def async_select_constructors(*case_id: int) -> defaultdict:
+        """
+        批量获取多个用例的构造数据
+        :param case_id:
+        :return: case_id -> 构造数据列表
+        """
+        try:
+            ans = defaultdict(list)
+            if not case_id:
+                return ans
+            async with async_session() as session:
+                sql = select(Constructor).where(Constructor.case_id.in_(case_id),
+                                                Constructor.deleted_at == None).order_by(Constructor.created_at)
+                data = await session.execute(sql)
+                for c in data.scalars().all():
+                    ans[c.case_id].append(c)
+                return ans
+        except Exception as e:
+            TestCaseDao.log.error(f"批量查询构造数据失败: {str(e)}")
+            raise Exception(f"批量查询构造数据失败: {str(e)}")
+
+    @staticmethod
+    def get_constructor_case_id(constructor: Constructor):
+        """
+        获取用例类型前置条件对应的用例id
+        """
+        return json.loads(constructor.constructor_json).get("case_id")
+
+    @staticmethod
+    async def collect_source(case_id: int):
+        """
+        按层遍历case_id可达的所有用例(前置条件中的用例)，每层用IN查询批量获取构造数据，最后一次性获取断言
+        :param case_id:
+        :return: case_id -> 构造数据列表, case_id -> 断言列表
+        """
+        constructors = dict()
+        current = {case_id}
+        while current:
+            data = await TestCaseDao.async_select_constructors(*current)
+            following = set()
+            for cid in current:
+                constructors[cid] = data[cid]
+                for c in data[cid]:
+                    if c.type == Config.ConstructorType.testcase:
+                        following.add(TestCaseDao.get_constructor_case_id(c))
+            # 已经查过的用例不再查询，用例之间互相引用时也不会死循环
+            current = {x for x in following if x is not None and x not in constructors}
+        asserts, err = await TestCaseAssertsDao.async_list_test_case_asserts_by_case_ids(*constructors.keys())
+        if err:
+            raise Exception("获取断言数据失败")
+        return constructors, asserts
+
+    @staticmethod
+    def collect_data(case_id: int, data: List, constructors: dict, asserts: dict, path: frozenset):
         """
         收集以case_id为前置条件的数据(后置暂时不支持)
         :param data:
         :param case_id:
+        :param constructors: case_id -> 构造数据列表
+        :param asserts: case_id -> 断言列表
+        :param path: 当前节点的所有祖先用例，用于检测循环引用
         :return:
         """
         # 先获取数据构造器（前置条件）
         pre = dict(id=f"pre_{case_id}", label="前置条件", children=list())
-        await TestCaseDao.collect_constructor(case_id, pre)
+        TestCaseDao.collect_constructor(case_id, pre, constructors, asserts, path)
         data.append(pre)
 
         # 获取断言
-        asserts = dict(id=f"asserts_{case_id}", label="断言", children=list())
-        await TestCaseDao.collect_asserts(case_id, asserts)
-        data.append(asserts)
+        case_asserts = dict(id=f"asserts_{case_id}", label="断言", children=list())
+        TestCaseDao.collect_asserts(case_id, case_asserts, asserts)
+        data.append(case_asserts)
 
     @staticmethod
-    async def collect_constructor(case_id, parent):
-        constructors = await TestCaseDao.async_select_constructor(case_id)
-        for c in constructors:
+    def collect_constructor(case_id, parent, constructors: dict, asserts: dict, path: frozenset):
+        for c in constructors.get(case_id, []):
             temp = dict(id=f"constructor_{c.id}", label=f"{c.name}", children=list())
             if c.type == 0:
                 # 说明是用例，继续递归
                 temp["label"] = "[CASE]: " + temp["label"]
-                json_data = json.loads(c.constructor_json)
-                await TestCaseDao.collect_data(json_data.get("case_id"), temp.get("children"))
+                child = TestCaseDao.get_constructor_case_id(c)
+                if child in path:
+                    # 用例之间循环引用，不再展开
+                    temp["label"] += "(循环引用)"
+                else:
+                    TestCaseDao.collect_data(child, temp.get("children"), constructors, asserts, path | {child})
             elif c.type == 1:
                 temp["label"] = "[SQL]: " + temp["label"]
             elif c.type == 2:
@@ -275,22 +347,21 @@ class TestCaseDao(object):
             parent.get("children").append(temp)
 
     @staticmethod
-    async def collect_asserts(case_id, parent):
-        asserts, err = await TestCaseAssertsDao.async_list_test_case_asserts(case_id)
-        if err:
-            raise Exception("获取断言数据失败")
-        for a in asserts:
+    def collect_asserts(case_id, parent, asserts: dict):
+        for a in asserts.get(case_id, []):
             temp = dict(id=f"assert_{a.id}", label=f"{a.name}", children=list())
             parent.get("children").append(temp)
 
     @staticmethod
     async def get_xmind_data(case_id: int):
         result = dict()
-        data = await TestCaseDao.query_test_case(case_id)
-        cs = data.get("case")
+        cs, err = await TestCaseDao.async_query_test_case(case_id)
+        if err:
+            raise Exception(err)
         # 开始解析测试数据
         result.update(dict(id=f"case_{case_id}", label=f"{cs.name}({cs.id})"))
+        constructors, asserts = await TestCaseDao.collect_source(case_id)
         children = list()
-        await TestCaseDao.collect_data(case_id, children)
+        TestCaseDao.collect_data(case_id, children, constructors, asserts, frozenset([case_id]))
         result["children"] = children
         return result
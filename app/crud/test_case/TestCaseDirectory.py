@@ -7,6 +7,7 @@ from app.models import async_session
 from app.models.schema.testcase_directory import PityTestcaseDirectoryForm
 from app.models.testcase_directory import PityTestcaseDirectory
 from app.utils.logger import Log
+from app.utils.tree_cache import ProjectTreeCache
 
 
 class PityTestcaseDirectoryDao(object):
@@ -51,6 +52,7 @@ class PityTestcaseDirectoryDao(object):
                     if result.scalars().first() is not None:
                         raise Exception("目录已存在")
                     session.add(PityTestcaseDirectory(form, user))
+            await ProjectTreeCache.async_bump(form.project_id)
         except Exception as e:
             PityTestcaseDirectoryDao.log.error(f"创建目录失败, error: {e}")
             raise Exception(f"创建目录失败: {e}")
@@ -69,6 +71,8 @@ class PityTestcaseDirectoryDao(object):
                     query.name = form.name
                     query.update_user = user
                     query.updated_at = datetime.now()
+                    project_id = query.project_id
+            await ProjectTreeCache.async_bump(project_id)
         except Exception as e:
             PityTestcaseDirectoryDao.log.error(f"更新目录失败, error: {e}")
             raise Exception(f"更新目录失败: {e}")
@@ -86,6 +90,8 @@ class PityTestcaseDirectoryDao(object):
                         raise Exception("目录不存在")
                     query.deleted_at = datetime.now()
                     query.update_user = user
+                    project_id = query.project_id
+            await ProjectTreeCache.async_bump(project_id)
         except Exception as e:
             PityTestcaseDirectoryDao.log.error(f"删除目录失败, error: {e}")
             raise Exception(f"删除目录失败: {e}")
@@ -2,6 +2,7 @@ from datetime import datetime
 
 from sqlalchemy import select, desc
 
+from app.crud.test_case.ReportDailyDao import ReportDailyDao
 from app.crud.test_case.TestResult import TestResultDao
 from app.models import async_session
 from app.models.report import PityReport
@@ -46,7 +47,8 @@ class TestReportDao(object):
 
     @staticmethod
     async def end(report_id: int, success_count: int, failed_count: int,
-                  error_count: int, skipped_count: int, status: int, cost: str) -> PityReport:
+                  error_count: int, skipped_count: int, status: int, cost: str,
+                  predicted_cost: str = None) -> PityReport:
         try:
             async with async_session() as session:
                 async with session.begin():
@@ -61,30 +63,39 @@ class TestReportDao(object):
                     report.error_count = error_count
                     report.skipped_count = skipped_count
                     report.cost = cost
+                    report.predicted_cost = predicted_cost
                     report.finished_at = datetime.now()
                     await session.flush()
                     session.expunge(report)
-                    return report
         except Exception as e:
             TestReportDao.log.error(f"更新报告失败, error: {e}")
             raise Exception("更新报告失败")
+        try:
+            # 汇总数据更新失败不影响报告本身, 可以通过回填命令修复
+            await ReportDailyDao.add_report(report)
+        except Exception:
+            pass
+        return report
 
     @staticmethod
-    async def query(report_id: int):
+    async def query(report_id: int, page: int = None, size: int = None, status: int = None):
         """
-        根据报告id查询报告
+        根据报告id查询报告, 用例执行记录只返回概要信息
         :param report_id:
+        :param page: 执行记录页码, 为空则返回全部
+        :param size: 执行记录每页数量
+        :param status: 执行记录状态
         :return:
         """
         try:
             async with async_session() as session:
                 sql = select(PityReport).where(PityReport.id == report_id)
                 data = await session.execute(sql)
-                if data is None:
-                    raise Exception("报告不存在")
                 report = data.scalars().first()
-                test_data = await TestResultDao.list(report_id)
-                return report, test_data
+                if report is None:
+                    raise Exception("报告不存在")
+                test_data, total = await TestResultDao.list_summary(report_id, page, size, status)
+                return report, test_data, total
         except Exception as e:
             TestReportDao.log.error(f"查询报告失败: {e}")
             raise Exception(f"查询报告失败: {e}")
@@ -1,15 +1,30 @@
-from datetime import datetime
+import math
+from datetime import datetime, timedelta
 
-from sqlalchemy import asc
+from sqlalchemy import asc, func
 from sqlalchemy.future import select
 
+from app.crud.test_case.ResponseBlobDao import ResponseBlobDao
+from app.handler.fatcory import PityResponse
 from app.models import async_session
+from app.models.report import PityReport
 from app.models.result import PityTestResult
+from app.models.test_case import TestCase
+from app.utils.compressor import TextCompressor
 from app.utils.logger import Log
+from config import Config
 
 
 class TestResultDao(object):
     log = Log("TestResultDao")
+    # 报告详情列表只返回这些轻量字段, response/case_log/headers等大字段通过query单独获取
+    summary_fields = [PityTestResult.id, PityTestResult.report_id, PityTestResult.case_id, PityTestResult.case_name,
+                      PityTestResult.status, PityTestResult.status_code, PityTestResult.cost,
+                      PityTestResult.data_name, PityTestResult.request_method, PityTestResult.retry,
+                      PityTestResult.start_at, PityTestResult.finished_at, PityTestResult.duration,
+                      PityTestResult.request_cost]
+    # 压缩存储的大字段
+    compress_fields = ["response", "case_log", "request_headers", "response_headers"]
 
     @staticmethod
     async def insert(report_id: int, case_id: int, case_name: str, status: int,
@@ -17,8 +32,8 @@ class TestResultDao(object):
                      url: str, body: str, request_method: str, request_headers: str, cost: str,
                      asserts: str, response_headers: str, response: str,
                      status_code: int, cookies: str, retry: int = None,
-                     request_params: str = '', data_name: str = ''
-                     ) -> None:
+                     request_params: str = '', data_name: str = '', duration: int = None,
+                     request_cost: int = None) -> None:
         try:
             async with async_session() as session:
                 async with session.begin():
@@ -26,13 +41,44 @@ class TestResultDao(object):
                                             case_log, start_at, finished_at,
                                             url, body, request_method, request_headers, cost,
                                             asserts, response_headers, response,
-                                            status_code, cookies, retry, request_params, data_name)
+                                            status_code, cookies, retry, request_params, data_name,
+                                            duration, request_cost)
+                    if response:
+                        # 相同的response只存储一份
+                        result.response_hash = await ResponseBlobDao.store(session, response)
+                        result.response = None
+                    for field in TestResultDao.compress_fields:
+                        setattr(result, field, TextCompressor.compress(getattr(result, field)))
                     session.add(result)
                     await session.flush()
         except Exception as e:
             TestResultDao.log.error(f"新增测试结果失败, error: {e}")
             raise Exception("新增测试结果失败")
 
+    @staticmethod
+    async def insert_skipped(report_id: int, jobs: list, reason: str) -> None:
+        """
+        批量写入被跳过的测试数据
+        :param report_id: 报告id
+        :param jobs: (case_id, 数据名称, 请求参数)列表
+        :param reason: 跳过原因
+        :return:
+        """
+        try:
+            async with async_session() as session:
+                async with session.begin():
+                    result = await session.execute(select(TestCase.id, TestCase.name).where(
+                        TestCase.id.in_({case_id for case_id, _, _ in jobs})))
+                    names = dict(result.all())
+                    now = datetime.now()
+                    session.add_all([PityTestResult(report_id, case_id, names.get(case_id), 3, reason, now, now,
+                                                    None, None, None, None, "0.00s", None, None, None, None, None,
+                                                    0, request_params, data_name)
+                                     for case_id, data_name, request_params in jobs])
+        except Exception as e:
+            TestResultDao.log.error(f"新增跳过的测试结果失败, error: {e}")
+            raise Exception("新增跳过的测试结果失败")
+
     @staticmethod
     async def list(report_id: int) -> None:
         try:
@@ -41,7 +87,154 @@ class TestResultDao(object):
                                                    PityTestResult.deleted_at == None).order_by(
                     asc(PityTestResult.case_id), asc(PityTestResult.start_at))
                 data = await session.execute(sql)
-                return data.scalars().all()
+                ans = data.scalars().all()
+                session.expunge_all()
+                blobs = await ResponseBlobDao.query(session, *(x.response_hash for x in ans))
+                for result in ans:
+                    TestResultDao.decompress(result, blobs)
+                return ans
+        except Exception as e:
+            TestResultDao.log.error(f"获取测试用例执行记录失败, error: {e}")
+            raise Exception("获取测试用例执行记录失败")
+
+    @staticmethod
+    async def list_summary(report_id: int, page: int = None, size: int = None, status: int = None):
+        """
+        获取报告下用例执行记录的概要信息，大字段不查询
+        :param report_id: 报告id
+        :param page: 页码, 为空则不分页
+        :param size: 每页数量, 不超过RESULT_MAX_PAGE_SIZE
+        :param status: 执行状态过滤
+        :return: 概要列表, 总数
+        """
+        try:
+            async with async_session() as session:
+                conditions = [PityTestResult.report_id == report_id, PityTestResult.deleted_at == None]
+                if status is not None:
+                    conditions.append(PityTestResult.status == status)
+                sql = select(*TestResultDao.summary_fields).where(*conditions).order_by(
+                    asc(PityTestResult.case_id), asc(PityTestResult.start_at))
+                if page is not None and size is not None:
+                    # 页码和数量不合法时修正到有效范围, 避免出现负数的OFFSET
+                    page = max(page, 1)
+                    size = min(max(size, 1), Config.RESULT_MAX_PAGE_SIZE)
+                    total = await session.execute(select(func.count(PityTestResult.id)).where(*conditions))
+                    total = total.scalar()
+                    if total == 0:
+                        return [], 0
+                    sql = sql.offset((page - 1) * size).limit(size)
+                    data = await session.execute(sql)
+                    return [PityResponse.json_serialize(x) for x in data.mappings().all()], total
+                data = await session.execute(sql)
+                ans = [PityResponse.json_serialize(x) for x in data.mappings().all()]
+                return ans, len(ans)
         except Exception as e:
             TestResultDao.log.error(f"获取测试用例执行记录失败, error: {e}")
             raise Exception("获取测试用例执行记录失败")
+
+    @staticmethod
+    async def query(result_id: int) -> PityTestResult:
+        """
+        获取单条用例执行记录的完整数据
+        :param result_id:
+        :return:
+        """
+        try:
+            async with async_session() as session:
+                sql = select(PityTestResult).where(PityTestResult.id == result_id, PityTestResult.deleted_at == None)
+                data = await session.execute(sql)
+                result = data.scalars().first()
+                if result is None:
+                    raise Exception("执行记录不存在")
+                session.expunge(result)
+                blobs = await ResponseBlobDao.query(session, result.response_hash)
+                return TestResultDao.decompress(result, blobs)
+        except Exception as e:
+            TestResultDao.log.error(f"获取测试用例执行记录失败, error: {e}")
+            raise Exception(f"获取测试用例执行记录失败: {e}")
+
+    @staticmethod
+    def decompress(result: PityTestResult, blobs: dict = None) -> PityTestResult:
+        """
+        解压执行记录中被压缩的大字段, 并填充去重存储的response
+        :param result:
+        :param blobs: response hash -> response内容
+        :return:
+        """
+        for field in TestResultDao.compress_fields:
+            setattr(result, field, TextCompressor.decompress(getattr(result, field)))
+        if result.response_hash and blobs:
+            result.response = blobs.get(result.response_hash)
+        return result
+
+    @staticmethod
+    async def average_duration(env: int, *case_id: int) -> dict:
+        """
+        获取用例最近一段时间在该环境下的平均耗时
+        :param env: 环境
+        :param case_id: 用例id
+        :return: case_id -> 平均耗时(ms), 没有历史数据的用例不返回
+        """
+        try:
+            async with async_session() as session:
+                sql = select(PityTestResult.case_id, func.avg(PityTestResult.duration)) \
+                    .join(PityReport, PityReport.id == PityTestResult.report_id) \
+                    .where(PityTestResult.case_id.in_(set(case_id)), PityReport.env == env,
+                           PityTestResult.status != 3, PityTestResult.duration != None,
+                           PityTestResult.start_at >= datetime.now() - timedelta(days=Config.PLAN_ESTIMATE_DAYS),
+                           PityTestResult.deleted_at == None) \
+                    .group_by(PityTestResult.case_id)
+                result = await session.execute(sql)
+                return {c: float(avg) for c, avg in result.all()}
+        except Exception as e:
+            TestResultDao.log.error(f"获取用例平均耗时失败, error: {e}")
+            raise Exception(f"获取用例平均耗时失败: {e}")
+
+    @staticmethod
+    def percentile(values: list, pct: float):
+        """
+        最近秩法计算百分位数
+        :param values: 已排序的数据
+        :param pct: 0-100
+        :return:
+        """
+        if not values:
+            return None
+        return values[max(math.ceil(pct / 100 * len(values)) - 1, 0)]
+
+    @staticmethod
+    def latency_stats(values: list):
+        values = sorted(v for v in values if v is not None)
+        if not values:
+            return dict(count=0, min=None, avg=None, p95=None, max=None)
+        return dict(count=len(values), min=values[0], avg=round(sum(values) / len(values), 2),
+                    p95=TestResultDao.percentile(values, 95), max=values[-1])
+
+    @staticmethod
+    async def list_latency(case_id: int, start_time: str, end_time: str, env: int = None):
+        """
+        获取用例在时间范围内的耗时序列及统计数据
+        :param case_id: 用例id
+        :param start_time: 开始时间
+        :param end_time: 结束时间
+        :param env: 环境
+        :return: 耗时序列, 统计数据
+        """
+        try:
+            async with async_session() as session:
+                conditions = [PityTestResult.case_id == case_id, PityTestResult.start_at.between(start_time, end_time),
+                              PityTestResult.duration != None, PityTestResult.deleted_at == None]
+                sql = select(PityTestResult.id, PityTestResult.report_id, PityTestResult.status,
+                             PityTestResult.start_at, PityTestResult.duration, PityTestResult.request_cost)
+                if env is not None:
+                    sql = sql.join(PityReport, PityReport.id == PityTestResult.report_id)
+                    conditions.append(PityReport.env == env)
+                sql = sql.where(*conditions).order_by(PityTestResult.start_at)
+                data = await session.execute(sql)
+                series = [PityResponse.json_serialize(x) for x in data.mappings().all()]
+                stats = dict(duration=TestResultDao.latency_stats([x["duration"] for x in series]),
+                             request_cost=TestResultDao.latency_stats([x["request_cost"] for x in series]))
+                return series, stats
+        except Exception as e:
+            TestResultDao.log.error(f"获取用例耗时数据失败, error: {e}")
+            raise Exception(f"获取用例耗时数据失败: {e}")
@@ -20,17 +20,19 @@ class AsyncRequest(object):
         return {k: v.value for k, v in cookies.items()}
 
     async def invoke(self, method: str):
-        start = time.time()
+        start = time.perf_counter()
         async with aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True)) as session:
             async with session.request(method, self.url, timeout=self.timeout, **self.kwargs) as resp:
                 if resp.status != 200:
-                    return await self.collect(False, self.kwargs.get("data"), resp.status)
-                cost = "%.0fms" % ((time.time() - start) * 1000)
+                    return await self.collect(False, self.kwargs.get("data"), resp.status,
+                                              request_cost=round((time.perf_counter() - start) * 1000))
+                request_cost = (time.perf_counter() - start) * 1000
+                cost = "%.0fms" % request_cost
                 response = await AsyncRequest.get_resp(resp)
                 cookie = self.get_cookie(session)
                 return await self.collect(True, self.kwargs.get("data"), resp.status, response,
                                           resp.headers, resp.request_info.headers, elapsed=cost,
-                                          cookies=cookie)
+                                          cookies=cookie, request_cost=round(request_cost))
 
     @staticmethod
     async def client(url: str, body_type: int, timeout=15, **kwargs):
@@ -93,7 +95,7 @@ class AsyncRequest(object):
 
     @staticmethod
     async def collect(status, request_data, status_code=200, response=None, response_headers=None,
-                      request_headers=None, cookies=None, elapsed=None, msg="success"):
+                      request_headers=None, cookies=None, elapsed=None, msg="success", request_cost=None):
         """
         收集http返回数据
         :param status: 请求状态
@@ -104,6 +106,7 @@ class AsyncRequest(object):
         :param request_headers:  请求header
         :param cookies:  cookie
         :param elapsed: 耗时
+        :param request_cost: http请求耗时(ms)
         :param msg: 报错信息
         :return:
         """
@@ -118,5 +121,5 @@ class AsyncRequest(object):
             "status": status, "response": response, "status_code": status_code,
             "request_data": AsyncRequest.get_request_data(request_data),
             "response_headers": response_headers, "request_headers": request_headers,
-            "msg": msg, "cost": elapsed, "cookies": cookies,
+            "msg": msg, "cost": elapsed, "cookies": cookies, "request_cost": request_cost,
         }
@@ -3,11 +3,13 @@ redis客户端Manager
 """
 import asyncio
 import functools
+import hashlib
 import json
+from collections import OrderedDict
 
-from awaits.awaitable import awaitable
-from redis import ConnectionPool, StrictRedis
-from rediscluster import RedisCluster, ClusterConnectionPool
+from redis import StrictRedis
+from redis.asyncio import Redis
+from redis.asyncio.cluster import RedisCluster, ClusterNode
 
 from app.excpetions.RedisException import RedisException
 from app.handler.fatcory import PityResponse
@@ -15,20 +17,34 @@ from config import Config
 
 
 class PityRedisManager(object):
-    """非线程安全，可能存在问题
+    """
+    基于redis.asyncio的客户端管理, 每个redis配置共享一个连接池, 命令直接在事件循环中执行
     """
     _cluster_pool = dict()
     _pool = dict()
+    _client = None
+    # lua脚本缓存: 脚本sha1 -> Script, 执行时使用EVALSHA, 服务端没有该脚本时自动重新加载
+    _scripts = OrderedDict()
 
     @property
     def client(self):
-        pool = ConnectionPool(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB, max_connections=100,
-                              password=Config.REDIS_PASSWORD,
-                              decode_responses=True)
-        return StrictRedis(connection_pool=pool, decode_responses=True)
+        """
+        pity自身使用的redis客户端, 整个进程共享
+        """
+        if PityRedisManager._client is None:
+            PityRedisManager._client = PityRedisManager.get_single_node(
+                f"{Config.REDIS_HOST}:{Config.REDIS_PORT}", Config.REDIS_PASSWORD, Config.REDIS_DB)
+        return PityRedisManager._client
+
+    @staticmethod
+    async def close(client):
+        try:
+            await client.close()
+        except Exception as e:
+            raise RedisException(f"关闭Redis连接失败, {e}")
 
     @staticmethod
-    def delete_client(redis_id: int, cluster: bool):
+    async def delete_client(redis_id: int, cluster: bool):
         """
         根据redis_id和是否是集群删除客户端
         :param redis_id:
@@ -36,9 +52,11 @@ class PityRedisManager(object):
         :return:
         """
         if cluster:
-            PityRedisManager._cluster_pool.pop(redis_id)
+            client = PityRedisManager._cluster_pool.pop(redis_id, None)
         else:
-            PityRedisManager._pool.pop(redis_id)
+            client = PityRedisManager._pool.pop(redis_id, None)
+        if client is not None:
+            await PityRedisManager.close(client)
 
     @staticmethod
     def get_cluster_client(redis_id: int, addr: str):
@@ -68,46 +86,82 @@ class PityRedisManager(object):
         node = PityRedisManager._pool.get(redis_id)
         if node is not None:
             return node
-        host, port = addr.split(":")
-        pool = ConnectionPool(host=host, port=port, db=db, max_connections=100, password=password,
-                              decode_responses=True)
-        client = StrictRedis(connection_pool=pool)
+        client = PityRedisManager.get_single_node(addr, password, db)
         PityRedisManager._pool[redis_id] = client
         return client
 
     @staticmethod
-    def refresh_redis_client(redis_id: int, addr: str, password: str, db: str):
+    async def refresh_redis_client(redis_id: int, addr: str, password: str, db: str):
         """
-        刷新redis客户端
+        刷新redis客户端, 新的客户端生效后关闭旧的连接池
         :param redis_id:
         :param addr:
         :param password:
         :param db:
         :return:
         """
-        host, port = addr.split(":")
-        pool = ConnectionPool(host=host, port=port, db=db, max_connections=100, password=password,
-                              decode_responses=True)
-        client = StrictRedis(connection_pool=pool, decode_responses=True)
-        PityRedisManager._pool[redis_id] = client
+        old = PityRedisManager._pool.get(redis_id)
+        PityRedisManager._pool[redis_id] = PityRedisManager.get_single_node(addr, password, db)
+        if old is not None:
+            await PityRedisManager.close(old)
 
     @staticmethod
-    def refresh_redis_cluster(redis_id: int, addr: str):
+    async def refresh_redis_cluster(redis_id: int, addr: str):
+        old = PityRedisManager._cluster_pool.get(redis_id)
         PityRedisManager._cluster_pool[redis_id] = PityRedisManager.get_cluster(addr)
+        if old is not None:
+            await PityRedisManager.close(old)
+
+    @staticmethod
+    def get_script(client, script: str):
+        """
+        获取lua脚本对象, 同一个脚本在不同客户端之间共享
+        :param client: 注册脚本使用的客户端
+        :param script: lua脚本
+        :return:
+        """
+        sha = hashlib.sha1(script.encode("utf-8")).hexdigest()
+        cache = PityRedisManager._scripts.get(sha)
+        if cache is not None:
+            PityRedisManager._scripts.move_to_end(sha)
+            return cache
+        cache = client.register_script(script)
+        PityRedisManager._scripts[sha] = cache
+        if len(PityRedisManager._scripts) > Config.REDIS_SCRIPT_CACHE_SIZE:
+            PityRedisManager._scripts.popitem(last=False)
+        return cache
+
+    @staticmethod
+    def get_single_node(addr: str, password: str, db: int):
+        """
+        获取单实例客户端, 连接在第一次执行命令时建立
+        :param addr: host:port
+        :param password:
+        :param db:
+        :return:
+        """
+        try:
+            host, port = addr.split(":")
+            return Redis(host=host, port=int(port), db=int(db or 0), password=password or None,
+                         max_connections=Config.REDIS_MAX_CONNECTIONS,
+                         health_check_interval=Config.REDIS_HEALTH_CHECK_INTERVAL,
+                         socket_connect_timeout=Config.REDIS_CONNECT_TIMEOUT, decode_responses=True)
+        except Exception as e:
+            raise RedisException(f"获取Redis连接失败, {e}")
 
     @staticmethod
     def get_cluster(addr: str):
         """
-        获取集群连接池
+        获取集群客户端, 每个节点各自维护连接池
         :param addr:
         :return:
         """
         try:
             nodes = addr.split(',')
-            startup_nodes = [{"host": n.split(":")[0], "port": n.split(":")[1]} for n in nodes]
-            pool = ClusterConnectionPool(startup_nodes=startup_nodes, max_connections=100, decode_responses=True)
-            client = RedisCluster(connection_pool=pool, decode_responses=True)
-            return client
+            startup_nodes = [ClusterNode(n.split(":")[0], int(n.split(":")[1])) for n in nodes]
+            return RedisCluster(startup_nodes=startup_nodes, max_connections=Config.REDIS_MAX_CONNECTIONS,
+                                health_check_interval=Config.REDIS_HEALTH_CHECK_INTERVAL,
+                                socket_connect_timeout=Config.REDIS_CONNECT_TIMEOUT, decode_responses=True)
         except Exception as e:
             raise RedisException(f"获取Redis连接失败, {e}")
 
@@ -115,11 +169,15 @@ class PityRedisManager(object):
 class RedisHelper(object):
     pity_prefix = "pity"
     pity_redis_client = PityRedisManager().client
+    # 同步方法的缓存装饰器使用
+    pity_redis_sync_client = StrictRedis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB,
+                                         password=Config.REDIS_PASSWORD, max_connections=10,
+                                         health_check_interval=Config.REDIS_HEALTH_CHECK_INTERVAL,
+                                         decode_responses=True)
 
     @staticmethod
-    @awaitable
-    def execute_command(client, command, *args, **kwargs):
-        return client.execute_command(command, *args, **kwargs)
+    async def execute_command(client, command, *args, **kwargs):
+        return await client.execute_command(command, *args, **kwargs)
 
     @staticmethod
     def get_key(key: str, *args):
@@ -141,7 +199,7 @@ class RedisHelper(object):
                 @functools.wraps(func)
                 async def wrapper(*args, **kwargs):
                     redis_key = RedisHelper.get_key(key, *args)
-                    data = RedisHelper.pity_redis_client.get(redis_key)
+                    data = await RedisHelper.pity_redis_client.get(redis_key)
                     # 缓存已存在
                     if data is not None:
                         return json.loads(data)
@@ -153,7 +211,7 @@ class RedisHelper(object):
                         else:
                             new_data = PityResponse.model_to_dict(new_data)
                     info = json.dumps(new_data, ensure_ascii=False)
-                    RedisHelper.pity_redis_client.set(redis_key, info, ex=expired_time)
+                    await RedisHelper.pity_redis_client.set(redis_key, info, ex=expired_time)
                     return new_data
 
                 return wrapper
@@ -161,7 +219,7 @@ class RedisHelper(object):
                 @functools.wraps(func)
                 def wrapper(*args, **kwargs):
                     redis_key = RedisHelper.get_key(key, *args)
-                    data = RedisHelper.pity_redis_client.get(redis_key)
+                    data = RedisHelper.pity_redis_sync_client.get(redis_key)
                     # 缓存已存在
                     if data is not None:
                         return json.loads(data)
@@ -173,7 +231,7 @@ class RedisHelper(object):
                         else:
                             new_data = PityResponse.model_to_dict(new_data)
                     info = json.dumps(new_data, ensure_ascii=False)
-                    RedisHelper.pity_redis_client.set(redis_key, info, ex=expired_time)
+                    RedisHelper.pity_redis_sync_client.set(redis_key, info, ex=expired_time)
                     return new_data
 
                 return wrapper
@@ -195,7 +253,7 @@ class RedisHelper(object):
                 async def wrapper(*args, **kwargs):
                     new_data = await func(*args, **kwargs)
                     # 更新数据，删除缓存
-                    RedisHelper.pity_redis_client.delete(redis_key)
+                    await RedisHelper.pity_redis_client.delete(redis_key)
                     return new_data
 
                 return wrapper
@@ -204,7 +262,7 @@ class RedisHelper(object):
                 @functools.wraps(func)
                 def wrapper(*args, **kwargs):
                     new_data = func(*args, **kwargs)
-                    RedisHelper.pity_redis_client.delete(redis_key)
+                    RedisHelper.pity_redis_sync_client.delete(redis_key)
                     return new_data
 
                 return wrapper
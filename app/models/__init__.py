@@ -1,13 +1,18 @@
+import asyncio
+import hashlib
 import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import List
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from app.utils.logger import Log
 from config import Config
 
 # 同步engine
@@ -26,39 +31,91 @@ Base.metadata.create_all(engine)
 
 
 class DatabaseHelper(object):
+    log = Log("DatabaseHelper")
 
     def __init__(self):
-        # cache
-        self.connections = dict()
+        # 数据源连接池缓存, 按最近使用排序, 最久未使用的在最前面
+        self.connections = OrderedDict()
+
+    @staticmethod
+    def get_key(sql_type: int, host: str, port: int, username: str, password: str, database: str):
+        # key中不能出现明文密码
+        return hashlib.sha256(f"{sql_type}:{host}:{port}:{username}:{password}:{database}".encode()).hexdigest()
 
     def get_connection(self, sql_type: int, host: str, port: int, username: str, password: str, database: str):
-        # 拼接key
-        key = f"{host}:{port}:{database}:{username}:{password}:{database}"
+        key = DatabaseHelper.get_key(sql_type, host, port, username, password, database)
         connection = self.connections.get(key)
         # 先判断是否已经有connection了，如果有则直接返回
         if connection is not None:
+            self.connections.move_to_end(key)
+            connection["last_used"] = time.time()
             return connection
         # 获取sqlalchemy需要的jdbc url
         jdbc_url = DatabaseHelper.get_jdbc_url(sql_type, host, port, username, password, database)
         if jdbc_url is None:
             return None
-        # 创建异步引擎
-        eg = create_engine(jdbc_url, pool_recycle=1500)
+        # 创建异步引擎, 每个数据源一个连接池
+        eg = create_async_engine(jdbc_url, pool_recycle=1500, pool_size=Config.DATASOURCE_POOL_SIZE,
+                                 max_overflow=Config.DATASOURCE_MAX_OVERFLOW,
+                                 pool_timeout=Config.DATASOURCE_POOL_TIMEOUT,
+                                 pool_pre_ping=Config.DATASOURCE_PRE_PING,
+                                 connect_args=DatabaseHelper.get_connect_args(sql_type))
         # 拿到session方法
-        ss = sessionmaker(bind=eg, autocommit=True)
+        ss = sessionmaker(bind=eg, class_=AsyncSession)
         # 将数据缓存起来
-        data = dict(engine=eg, session=ss)
+        data = dict(engine=eg, session=ss, sql_type=sql_type, name=f"{username}@{host}:{port}/{database}", last_used=time.time(),
+                    wait_count=0, wait_total=0.0, wait_max=0.0)
         self.connections[key] = data
+        # 超过上限时从最久未使用的开始释放, 有连接正在使用的连接池跳过, 之后由dispose_idle释放
+        for k in [k for k in self.connections if k != key]:
+            if len(self.connections) <= Config.DATASOURCE_MAX_ENGINES:
+                break
+            evicted = self.connections[k]
+            if evicted["engine"].sync_engine.pool.checkedout() > 0:
+                continue
+            self.connections.pop(k)
+            DatabaseHelper.log.info(f"数据源连接池数量超过上限, 释放: {evicted['name']}")
+            asyncio.ensure_future(evicted["engine"].dispose())
         return data
 
     @staticmethod
-    def test_connection(ss):
-        if ss is None:
+    async def acquire(data: dict):
+        """
+        从数据源连接池获取连接, 并记录获取连接的耗时, 使用完需要调用close归还
+        :param data: get_connection的返回值
+        :return:
+        """
+        st = time.perf_counter()
+        conn = await data["engine"].connect()
+        wait = time.perf_counter() - st
+        data["wait_count"] += 1
+        data["wait_total"] += wait
+        data["wait_max"] = max(data["wait_max"], wait)
+        data["last_used"] = time.time()
+        return conn
+
+    @staticmethod
+    @asynccontextmanager
+    async def connect(data: dict):
+        conn = await DatabaseHelper.acquire(data)
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+    @staticmethod
+    async def test_connection(data: dict):
+        if data is None:
             return "暂不支持的数据库类型"
+
+        async def select_one():
+            async with DatabaseHelper.connect(data) as conn:
+                await conn.execute(text("select 1"))
+
         try:
-            with ss() as session:
-                with session.begin():
-                    session.execute("select 1")
+            await asyncio.wait_for(select_one(), Config.DATASOURCE_CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return f"连接超时({Config.DATASOURCE_CONNECT_TIMEOUT}s)"
         except Exception as e:
             return str(e)
         return None
@@ -67,15 +124,159 @@ class DatabaseHelper(object):
     def get_jdbc_url(sql_type: int, host: str, port: int, username: str, password: str, database: str):
         if sql_type == 0:
             # mysql模式
-            return f'mysql+mysqlconnector://{username}:{password}@{host}:{port}/{database}'
+            return f'mysql+aiomysql://{username}:{password}@{host}:{port}/{database}'
         elif sql_type == 1:
-            return f'postgresql+psycopg2://{username}:{password}@{host}:{port}/{database}'
+            return f'postgresql+asyncpg://{username}:{password}@{host}:{port}/{database}'
+        return None
+
+    @staticmethod
+    def get_timeout(timeout: int = None):
+        """
+        获取sql超时时间(ms)
+        """
+        return timeout or Config.DATASOURCE_QUERY_TIMEOUT * 1000
+
+    @staticmethod
+    async def set_timeout(conn, sql_type: int, timeout: int):
+        """
+        设置连接的语句超时时间(ms), 由数据库服务端中断超时的语句
+        mysql的MAX_EXECUTION_TIME只对select生效, mariadb使用max_statement_time(秒); postgresql使用SET LOCAL, 事务结束后恢复
+        不受服务端超时限制的语句由wait_for超时后kill
+        :return: 连接在数据库服务端的线程/进程id
+        """
+        if sql_type == 0:
+            result = await conn.exec_driver_sql("SELECT CONNECTION_ID(), VERSION()")
+            backend_id, version = result.first()
+            try:
+                if "mariadb" in str(version).lower():
+                    await conn.exec_driver_sql(f"SET SESSION max_statement_time = {timeout / 1000}")
+                else:
+                    await conn.exec_driver_sql(f"SET SESSION MAX_EXECUTION_TIME = {int(timeout)}")
+            except Exception as e:
+                # 不支持语句超时的版本只依赖超时后kill
+                DatabaseHelper.log.warning(f"设置语句超时时间失败, version: {version}, error: {e}")
+            return backend_id
+        if sql_type == 1:
+            await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+            result = await conn.exec_driver_sql("SELECT pg_backend_pid()")
+            return result.scalar()
         return None
 
-    def remove_connection(self, host: str, port: int, username: str, password: str, database: str):
-        key = f"{host}:{port}:{database}:{username}:{password}:{database}"
-        if self.connections.get(key):
-            self.connections.pop(key)
+    @staticmethod
+    async def wait_for(data: dict, conn, aw, wait: float, backend_id: int = None):
+        """
+        等待语句执行完成, 超时后通过新的连接中断数据库中仍在执行的语句, 并丢弃当前连接
+        :param data: get_connection的返回值
+        :param conn: 执行语句的连接
+        :param aw: 语句执行的awaitable
+        :param wait: 等待时间(秒)
+        :param backend_id: set_timeout的返回值
+        :return:
+        """
+        try:
+            return await asyncio.wait_for(aw, wait)
+        except asyncio.TimeoutError:
+            if backend_id is not None:
+                await DatabaseHelper.kill(data, backend_id)
+            try:
+                # 读取到一半被取消的连接状态不可用, 不能放回连接池
+                await conn.invalidate()
+            except Exception as e:
+                DatabaseHelper.log.error(f"丢弃超时的连接失败: {e}")
+            raise
+
+    @staticmethod
+    async def kill(data: dict, backend_id: int):
+        """
+        使用新的连接中断超时的语句, 失败时只记录日志
+        """
+        async def cancel():
+            async with DatabaseHelper.connect(data) as c:
+                await DatabaseHelper.cancel(c, data["sql_type"], backend_id)
+
+        try:
+            # 连接池可能已被占满, 获取连接的时间也计入超时
+            await asyncio.wait_for(cancel(), Config.DATASOURCE_CONNECT_TIMEOUT)
+            DatabaseHelper.log.info(f"已中断超时的语句, 数据源: {data['name']}, id: {backend_id}")
+        except Exception as e:
+            DatabaseHelper.log.error(f"中断超时的语句失败, 数据源: {data['name']}, id: {backend_id}, error: {e}")
+
+    @staticmethod
+    async def cancel(conn, sql_type: int, backend_id: int):
+        """
+        中断指定连接正在执行的语句, 连接本身不会断开
+        """
+        if sql_type == 0:
+            await conn.exec_driver_sql(f"KILL QUERY {int(backend_id)}")
+        elif sql_type == 1:
+            await conn.exec_driver_sql(f"SELECT pg_cancel_backend({int(backend_id)})")
+
+    @staticmethod
+    def get_connect_args(sql_type: int):
+        """
+        不同驱动的建立连接超时参数名不同
+        """
+        if sql_type == 0:
+            return dict(connect_timeout=Config.DATASOURCE_CONNECT_TIMEOUT)
+        if sql_type == 1:
+            return dict(timeout=Config.DATASOURCE_CONNECT_TIMEOUT)
+        return dict()
+
+    async def remove_connection(self, sql_type: int, host: str, port: int, username: str, password: str,
+                                database: str):
+        """
+        数据源配置修改或删除时释放对应的连接池
+        """
+        data = self.connections.pop(DatabaseHelper.get_key(sql_type, host, port, username, password, database),
+                                    None)
+        if data is not None:
+            await data["engine"].dispose()
+
+    async def dispose_idle(self):
+        """
+        释放闲置超时的连接池
+        """
+        now = time.time()
+        for key in [k for k, v in self.connections.items()
+                    if now - v["last_used"] > Config.DATASOURCE_IDLE_TIMEOUT]:
+            data = self.connections.pop(key)
+            if data["engine"].sync_engine.pool.checkedout() > 0:
+                # 仍有连接在使用中, 下次再检查
+                self.connections[key] = data
+                continue
+            DatabaseHelper.log.info(f"数据源连接池闲置超时, 释放: {data['name']}")
+            await data["engine"].dispose()
+
+    async def dispose_idle_forever(self):
+        while True:
+            await asyncio.sleep(60)
+            try:
+                await self.dispose_idle()
+            except Exception as e:
+                DatabaseHelper.log.error(f"释放闲置连接池失败: {e}")
+
+    def stats(self):
+        """
+        获取每个数据源连接池的使用情况
+        :return:
+        """
+        ans = list()
+        now = time.time()
+        for key, data in reversed(self.connections.items()):
+            pool = data["engine"].sync_engine.pool
+            ans.append(dict(
+                key=key[:12],
+                name=data["name"],
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+                idle_seconds=round(now - data["last_used"]),
+                wait_count=data["wait_count"],
+                wait_avg_ms=round(data["wait_total"] / data["wait_count"] * 1000, 2) if data["wait_count"] else 0,
+                wait_max_ms=round(data["wait_max"] * 1000, 2),
+            ))
+        return ans
 
     @staticmethod
     def update_model(dist, source, update_user=None, not_null=False):
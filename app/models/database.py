@@ -20,13 +20,15 @@ class PityDatabase(Base):
     password = Column(String(64), nullable=False)
     database = Column(String(36), nullable=False)
     sql_type = Column(INT, nullable=False, comment="0: mysql 1: postgresql 2: mongo")
+    # sql执行超时时间(ms), 为空则使用默认值
+    timeout = Column(INT, nullable=True)
     created_at = Column(DATETIME, nullable=False)
     updated_at = Column(DATETIME, nullable=False)
     deleted_at = Column(DATETIME)
     create_user = Column(INT, nullable=True)
     update_user = Column(INT, nullable=True)
 
-    def __init__(self, env, name, host, port, username, password, database, sql_type, user, id=0):
+    def __init__(self, env, name, host, port, username, password, database, sql_type, user, timeout=None, id=0):
         self.id = id
         self.env = env
         self.name = name
@@ -36,6 +38,7 @@ class PityDatabase(Base):
         self.password = password
         self.database = database
         self.sql_type = sql_type
+        self.timeout = timeout
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
         self.create_user = user
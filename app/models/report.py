@@ -16,6 +16,8 @@ class PityReport(Base):
     env = Column(INT, nullable=False)
     # 花费时间
     cost = Column(String(8))
+    # 根据历史耗时预测的执行时间(秒)
+    predicted_cost = Column(String(8))
     # 测试集合id，预留字段
     plan_id = Column(INT, index=True, nullable=True)
     # 开始时间
@@ -52,4 +54,5 @@ class PityReport(Base):
         self.status = status
         self.plan_id = plan_id
         self.finished_at = finished_at
+        self.predicted_cost = None
         self.deleted_at = None
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from sqlalchemy import Column, INT, DATE, DATETIME, BIGINT, UniqueConstraint, Index
+
+from app.models import Base
+
+
+class PityReportDaily(Base):
+    """
+    测试报告按天汇总表, 每个(项目, 测试计划, 环境, 日期)一行, 报告结束时增量累加
+    """
+    __tablename__ = "pity_report_daily"
+    __table_args__ = (
+        UniqueConstraint('project_id', 'plan_id', 'env', 'day', name='uk_project_plan_env_day'),
+        Index('idx_day', 'day'),
+    )
+
+    id = Column(INT, primary_key=True)
+    # 没有测试计划的报告project_id和plan_id都记为0
+    project_id = Column(INT, nullable=False, default=0)
+    plan_id = Column(INT, nullable=False, default=0)
+    env = Column(INT, nullable=False)
+    day = Column(DATE, nullable=False)
+    # 报告数量
+    report_count = Column(INT, nullable=False, default=0)
+    # 用例执行次数及各状态数量
+    case_count = Column(INT, nullable=False, default=0)
+    success_count = Column(INT, nullable=False, default=0)
+    failed_count = Column(INT, nullable=False, default=0)
+    error_count = Column(INT, nullable=False, default=0)
+    skipped_count = Column(INT, nullable=False, default=0)
+    # 报告总耗时(ms)
+    cost_sum = Column(BIGINT, nullable=False, default=0)
+    cost_max = Column(INT, nullable=False, default=0)
+    # 用例耗时(ms), 只统计有耗时的用例
+    duration_sum = Column(BIGINT, nullable=False, default=0)
+    duration_count = Column(INT, nullable=False, default=0)
+    duration_max = Column(INT, nullable=False, default=0)
+    updated_at = Column(DATETIME, nullable=False)
+
+    def __init__(self, project_id, plan_id, env, day):
+        self.project_id = project_id
+        self.plan_id = plan_id
+        self.env = env
+        self.day = day
+        self.updated_at = datetime.now()
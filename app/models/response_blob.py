@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from sqlalchemy import Column, String, INT, DATETIME
+from sqlalchemy.dialects.mysql import LONGTEXT
+
+from app.models import Base
+
+
+class PityResponseBlob(Base):
+    """
+    response内容表, 以内容hash为主键, 相同的response只存一份
+    """
+    __tablename__ = "pity_response_blob"
+
+    # sha256(response)
+    hash = Column(String(64), primary_key=True)
+    # response内容, 可能被压缩
+    content = Column(LONGTEXT)
+    # 原始内容长度
+    size = Column(INT, nullable=False, default=0)
+    created_at = Column(DATETIME, nullable=False)
+
+    def __init__(self, hash, content, size):
+        self.hash = hash
+        self.content = content
+        self.size = size
+        self.created_at = datetime.now()
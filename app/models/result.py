@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import INT, Column, DATETIME, String
+from sqlalchemy import INT, Column, DATETIME, String, Index
 from sqlalchemy import SMALLINT
 from sqlalchemy import TEXT
 from sqlalchemy.dialects.mysql import LONGTEXT
@@ -10,6 +10,10 @@ from app.models import Base
 
 class PityTestResult(Base):
     __tablename__ = 'pity_test_result'
+    # 按用例查询耗时趋势
+    __table_args__ = (
+        Index('idx_case_start_at', 'case_id', 'start_at'),
+    )
     id = Column(INT, primary_key=True)
 
     # 报告id
@@ -50,12 +54,21 @@ class PityTestResult(Base):
 
     cost = Column(String(12), nullable=False)
 
+    # 用例总耗时(ms)
+    duration = Column(INT)
+
+    # http请求耗时(ms)
+    request_cost = Column(INT)
+
     asserts = Column(TEXT)
 
     response_headers = Column(TEXT)
 
     response = Column(LONGTEXT)
 
+    # response内容hash, 对应pity_response_blob, 不为空时response字段为空
+    response_hash = Column(String(64), index=True)
+
     cookies = Column(TEXT)
 
     deleted_at = Column(DATETIME, index=True)
@@ -65,7 +78,7 @@ class PityTestResult(Base):
                  url: str, body: str, request_method: str, request_headers: str, cost: str,
                  asserts: str, response_headers: str, response: str,
                  status_code: int, cookies: str, retry: int = None,
-                 request_params: str = '', data_name: str = ''
+                 request_params: str = '', data_name: str = '', duration: int = None, request_cost: int = None
                  ):
         self.report_id = report_id
         self.case_id = case_id
@@ -83,9 +96,12 @@ class PityTestResult(Base):
         self.body = body
         self.cost = cost
         self.response = response
+        self.response_hash = None
         self.response_headers = response_headers
         self.asserts = asserts
         self.cookies = cookies
         self.deleted_at = None
         self.request_params = request_params
         self.data_name = data_name
+        self.duration = duration
+        self.request_cost = request_cost
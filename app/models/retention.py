@@ -0,0 +1,32 @@
+from sqlalchemy import Column, INT, UniqueConstraint
+
+from app.models.basic import PityBase
+
+
+class PityRetention(PityBase):
+    """
+    报告保留策略, 测试计划级别优先于项目级别, 都没有配置时使用Config中的默认值
+    """
+    __tablename__ = "pity_retention"
+    __table_args__ = (
+        UniqueConstraint('project_id', 'plan_id', 'deleted_at'),
+    )
+
+    project_id = Column(INT, nullable=False)
+    # 为空说明是项目级别的策略
+    plan_id = Column(INT, nullable=True)
+    # 保留最近N次执行记录, 为空不限制
+    keep_runs = Column(INT, nullable=True)
+    # 保留最近N天的执行记录, 为空不限制
+    keep_days = Column(INT, nullable=True)
+    # 有失败/出错用例的报告保留天数, 为空则与普通报告一致
+    keep_failed_days = Column(INT, nullable=True)
+
+    def __init__(self, project_id, user, plan_id=None, keep_runs=None, keep_days=None, keep_failed_days=None,
+                 id=None):
+        super().__init__(user, id=id)
+        self.project_id = project_id
+        self.plan_id = plan_id
+        self.keep_runs = keep_runs
+        self.keep_days = keep_days
+        self.keep_failed_days = keep_failed_days
@@ -13,6 +13,8 @@ class DatabaseForm(BaseModel):
     database: str
     sql_type: int
     env: int
+    # sql执行超时时间(ms)
+    timeout: int = None
 
     @validator("name", "host", "port", "username", "password", "database", "sql_type", "env")
     def data_not_empty(cls, v):
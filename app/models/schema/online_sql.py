@@ -6,6 +6,12 @@ from app.models.schema.base import PityModel
 class OnlineSQLForm(BaseModel):
     id: int = None
     sql: str
+    # 每页返回的行数
+    limit: int = None
+    # 客户端生成的查询id, 用于中断正在执行的sql
+    query_id: str = None
+    # 翻页时传入上一页返回的offset
+    offset: int = 0
 
     @validator("sql", 'id')
     def name_not_empty(cls, v):
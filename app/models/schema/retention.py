@@ -0,0 +1,16 @@
+from pydantic import BaseModel, validator
+
+from app.models.schema.base import PityModel
+
+
+class RetentionForm(BaseModel):
+    id: int = None
+    project_id: int
+    plan_id: int = None
+    keep_runs: int = None
+    keep_days: int = None
+    keep_failed_days: int = None
+
+    @validator("project_id")
+    def data_not_empty(cls, v):
+        return PityModel.not_empty(v)
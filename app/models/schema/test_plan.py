@@ -18,6 +18,9 @@ class PityTestPlanForm(BaseModel):
     receiver: List[int] = list()
     msg_type: List[int] = list()
     retry_minutes: int = 0
+    storage_policy: int = 0
+    fail_fast: bool = False
+    error_threshold: int = 0
 
     @validator("case_list", "project_id", "env", "cron", "ordered", "priority", "name", "pass_rate")
     def name_not_empty(cls, v):
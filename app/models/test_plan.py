@@ -28,6 +28,12 @@ class PityTestPlan(PityBase):
     retry_minutes = Column(SMALLINT, default=2)
     # 测试计划是否正在执行中
     state = Column(SMALLINT, default=0, comment="0: 未开始 1: 运行中")
+    # 测试结果存储策略
+    storage_policy = Column(SMALLINT, default=0, comment="0: 全部保存 1: 成功用例只保存概要 2: 成功用例保存截断的样本")
+    # 快速失败, 通过率已无法达到pass_rate或失败率超过阈值时跳过剩余用例
+    fail_fast = Column(BOOLEAN, default=False)
+    # 快速失败的失败率阈值(百分比), 0表示不检查
+    error_threshold = Column(SMALLINT, default=0)
 
     __table_args__ = (
         UniqueConstraint('project_id', 'name', 'deleted_at'),
@@ -36,7 +42,7 @@ class PityTestPlan(PityBase):
     __tablename__ = "pity_test_plan"
 
     def __init__(self, project_id, env, case_list, name, priority, cron, ordered, pass_rate, receiver, msg_type,
-                 retry_minutes, user, state=0, id=None):
+                 retry_minutes, user, state=0, storage_policy=0, fail_fast=False, error_threshold=0, id=None):
         super().__init__(user, id)
         self.env = ",".join(map(str, env))
         self.case_list = ",".join(map(str, case_list))
@@ -50,3 +56,6 @@ class PityTestPlan(PityBase):
         self.msg_type = ",".join(map(str, msg_type))
         self.retry_minutes = retry_minutes
         self.state = state
+        self.storage_policy = storage_policy
+        self.fail_fast = fail_fast
+        self.error_threshold = error_threshold
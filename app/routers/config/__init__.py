@@ -2,3 +2,4 @@ from app.routers.config.environment import router
 from app.routers.config.gconfig import router
 from app.routers.config.dbconfig import router
 from app.routers.config.redis_config import router
+from app.routers.config.retention import router
@@ -47,16 +47,27 @@ async def delete_dbconfig(id: int, user_info=Depends(Permission(Config.ADMIN))):
 
 
 @router.get("/dbconfig/connect")
-def connect_test(sql_type: int, host: str, port: int, username: str, password: str, database: str,
+async def connect_test(sql_type: int, host: str, port: int, username: str, password: str, database: str,
                  user_info=Depends(Permission(Config.ADMIN))):
     try:
         data = db_helper.get_connection(sql_type, host, port, username, password,
                                         database)
         if data is None:
             raise Exception("测试连接失败")
-        err = DatabaseHelper.test_connection(data.get("session"))
+        err = await DatabaseHelper.test_connection(data)
         if err:
             return PityResponse.failed(msg=err)
         return PityResponse.success(msg="连接成功")
     except Exception as e:
         return PityResponse.failed(str(e))
+
+
+@router.get("/dbconfig/pool")
+async def list_dbconfig_pool(user_info=Depends(Permission(Config.ADMIN))):
+    """
+    获取当前进程中数据源连接池的使用情况
+    """
+    try:
+        return PityResponse.success(db_helper.stats())
+    except Exception as e:
+        return PityResponse.failed(e)
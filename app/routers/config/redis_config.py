@@ -1,6 +1,7 @@
 from fastapi import Depends
 from starlette.background import BackgroundTasks
 
+from app.core.redis_browser import RedisBrowser
 from app.crud.config.RedisConfigDao import PityRedisConfigDao
 from app.handler.fatcory import PityResponse
 from app.middleware.RedisManager import PityRedisManager
@@ -72,7 +73,40 @@ async def delete_redis_config(id: int, background_tasks: BackgroundTasks,
 @router.post("/redis/command")
 async def test_redis_command(form: OnlineRedisForm):
     try:
+        if form.command.split(maxsplit=1)[0].upper() == "KEYS":
+            # KEYS会阻塞redis, 改用key浏览器分批遍历
+            raise Exception("不支持KEYS命令, 请使用key浏览器查询")
         res = await PityRedisConfigDao.execute_command(form.command, id=form.id)
         return PityResponse.success(res)
     except Exception as err:
         return PityResponse.failed(err)
+
+
+@router.get("/redis/keys")
+async def scan_redis_keys(id: int, cursor: str = None, pattern: str = None, type: str = None, count: int = None,
+                          user_info=Depends(Permission(Config.MEMBER))):
+    try:
+        data = await RedisBrowser.scan_keys(id, cursor, pattern, type, count)
+        return PityResponse.success(data)
+    except Exception as err:
+        return PityResponse.failed(err)
+
+
+@router.get("/redis/members")
+async def scan_redis_members(id: int, key: str, cursor: str = None, pattern: str = None, count: int = None,
+                             user_info=Depends(Permission(Config.MEMBER))):
+    try:
+        data = await RedisBrowser.scan_members(id, key, cursor, pattern, count)
+        return PityResponse.success(data)
+    except Exception as err:
+        return PityResponse.failed(err)
+
+
+@router.get("/redis/value")
+async def get_redis_value(id: int, key: str, start: int = 0, end: int = None,
+                          user_info=Depends(Permission(Config.MEMBER))):
+    try:
+        data = await RedisBrowser.get_value(id, key, start, end)
+        return PityResponse.success(data)
+    except Exception as err:
+        return PityResponse.failed(err)
@@ -0,0 +1,50 @@
+from fastapi import Depends
+
+from app.crud.config.RetentionDao import PityRetentionDao
+from app.handler.fatcory import PityResponse
+from app.models.retention import PityRetention
+from app.models.schema.retention import RetentionForm
+from app.routers import Permission
+from app.routers.config.environment import router
+from config import Config
+
+
+@router.get("/retention/list")
+async def list_retention(project_id: int = None, plan_id: int = None, user_info=Depends(Permission(Config.MEMBER))):
+    try:
+        data = await PityRetentionDao.list_record(project_id=project_id, plan_id=plan_id)
+        return PityResponse.success(data=PityResponse.model_to_list(data))
+    except Exception as err:
+        return PityResponse.failed(err)
+
+
+@router.post("/retention/insert")
+async def insert_retention(form: RetentionForm, user_info=Depends(Permission(Config.ADMIN))):
+    try:
+        # plan_id为空时query_wrapper不会过滤, 所以这里取出项目下所有策略再比较
+        records = await PityRetentionDao.list_record(project_id=form.project_id)
+        if any(r.plan_id == form.plan_id for r in records):
+            raise Exception("保留策略已存在, 请勿重复添加")
+        data = PityRetention(**form.dict(), user=user_info['id'])
+        result = await PityRetentionDao.insert_record(data)
+        return PityResponse.success(data=PityResponse.model_to_dict(result))
+    except Exception as err:
+        return PityResponse.failed(err)
+
+
+@router.post("/retention/update")
+async def update_retention(form: RetentionForm, user_info=Depends(Permission(Config.ADMIN))):
+    try:
+        result = await PityRetentionDao.update_record_by_id(user_info['id'], form)
+        return PityResponse.success(data=PityResponse.model_to_dict(result))
+    except Exception as err:
+        return PityResponse.failed(err)
+
+
+@router.get("/retention/delete")
+async def delete_retention(id: int, user_info=Depends(Permission(Config.ADMIN))):
+    try:
+        await PityRetentionDao.delete_record_by_id(user_info['id'], id)
+        return PityResponse.success()
+    except Exception as err:
+        return PityResponse.failed(err)
@@ -1,5 +1,6 @@
 from fastapi import Depends
 
+from app.core.script_runner import ScriptRunner
 from app.handler.fatcory import PityResponse
 from app.models.schema.script import PyScriptForm
 from app.routers import Permission
@@ -7,11 +8,9 @@ from app.routers.online.sql import router
 
 
 @router.post("/script")
-def execute_py_script(data: PyScriptForm, user_info=Depends(Permission())):
+async def execute_py_script(data: PyScriptForm, user_info=Depends(Permission())):
     try:
-        loc = dict()
-        exec(data.command, loc)
-        value = loc.get(data.value)
+        value = await ScriptRunner.run(data.command, data.value)
         return PityResponse.success(data=value)
     except Exception as err:
         return PityResponse.failed(err)
@@ -11,17 +11,36 @@ router = APIRouter(prefix="/online")
 @router.post("/sql")
 async def execute_sql(data: OnlineSQLForm, user_info=Depends(Permission())):
     try:
-        result = await DbConfigDao.online_sql(data.id, data.sql)
-        columns, result = PityResponse.parse_sql_result(result)
-        return PityResponse.success(data=dict(result=result, columns=columns))
+        result = await DbConfigDao.online_sql(data.id, data.sql, data.limit, data.query_id, data.offset)
+        return PityResponse.success(data=result)
+    except Exception as err:
+        return PityResponse.failed(err)
+
+
+# 中断正在执行的查询
+@router.get("/sql/kill")
+async def kill_sql(query_id: str, user_info=Depends(Permission())):
+    try:
+        await DbConfigDao.kill_query(query_id)
+        return PityResponse.success(msg="已中断查询")
     except Exception as err:
         return PityResponse.failed(err)
 
 
 @router.get("/tables")
-async def list_tables(user_info=Depends(Permission())):
+async def list_tables(refresh: bool = False, user_info=Depends(Permission())):
     try:
-        result, table_map = await DbConfigDao.query_database_and_tables()
+        result, table_map = await DbConfigDao.query_database_and_tables(refresh)
         return PityResponse.success(dict(database=result, tables=table_map))
     except Exception as err:
         return PityResponse.failed(err)
+
+
+# 重新获取单个数据库的表结构
+@router.get("/tables/refresh")
+async def refresh_tables(id: int, user_info=Depends(Permission())):
+    try:
+        database, tables = await DbConfigDao.refresh_schema(id)
+        return PityResponse.success(dict(database=database, tables=tables))
+    except Exception as err:
+        return PityResponse.failed(err)
@@ -1 +1 @@
-from app.routers.testcase.testplan import router
+from app.routers.testcase.analytics import router
@@ -0,0 +1,49 @@
+from fastapi import Depends
+
+from app.core.analytics import ReportAnalytics
+from app.handler.fatcory import PityResponse
+from app.routers import Permission
+from app.routers.testcase.testplan import router
+
+
+@router.get("/analytics/trend")
+async def analytics_trend(start_time: str, end_time: str, project_id: int = None, env: int = None,
+                          user_info=Depends(Permission())):
+    try:
+        data = await ReportAnalytics.analyze(start_time, end_time, project_id, env)
+        return PityResponse.success(dict(total=data["total"], pass_rate=data["pass_rate"], trend=data["trend"]))
+    except Exception as e:
+        return PityResponse.failed(e)
+
+
+@router.get("/analytics/latency")
+async def analytics_latency(start_time: str, end_time: str, project_id: int = None, env: int = None,
+                            case_id: int = None, user_info=Depends(Permission())):
+    try:
+        data = await ReportAnalytics.analyze(start_time, end_time, project_id, env)
+        latency = data["latency"]
+        if case_id is not None:
+            latency = [x for x in latency if x["case_id"] == case_id]
+        return PityResponse.success(latency)
+    except Exception as e:
+        return PityResponse.failed(e)
+
+
+@router.get("/analytics/slowest")
+async def analytics_slowest(start_time: str, end_time: str, project_id: int = None, env: int = None,
+                            size: int = 10, user_info=Depends(Permission())):
+    try:
+        data = await ReportAnalytics.analyze(start_time, end_time, project_id, env)
+        return PityResponse.success(data["latency"][:size])
+    except Exception as e:
+        return PityResponse.failed(e)
+
+
+@router.get("/analytics/flaky")
+async def analytics_flaky(start_time: str, end_time: str, project_id: int = None, env: int = None,
+                          size: int = 10, user_info=Depends(Permission())):
+    try:
+        data = await ReportAnalytics.analyze(start_time, end_time, project_id, env)
+        return PityResponse.success(data["flaky"][:size])
+    except Exception as e:
+        return PityResponse.failed(e)
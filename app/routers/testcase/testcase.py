@@ -1,12 +1,17 @@
 from typing import List
 
 from fastapi import APIRouter, Depends
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
 
+from app.core.exporter import ReportExporter
 from app.crud.test_case.ConstructorDao import ConstructorDao
 from app.crud.test_case.TestCaseAssertsDao import TestCaseAssertsDao
 from app.crud.test_case.TestCaseDao import TestCaseDao
+from app.crud.test_case.ReportDailyDao import ReportDailyDao
 from app.crud.test_case.TestCaseDirectory import PityTestcaseDirectoryDao
 from app.crud.test_case.TestReport import TestReportDao
+from app.crud.test_case.TestResult import TestResultDao
 from app.crud.test_case.TestcaseDataDao import PityTestcaseDataDao
 from app.handler.fatcory import PityResponse
 from app.models.schema.constructor import ConstructorForm, ConstructorIndex
@@ -14,6 +19,7 @@ from app.models.schema.testcase_data import PityTestcaseDataForm
 from app.models.schema.testcase_directory import PityTestcaseDirectoryForm
 from app.models.schema.testcase_schema import TestCaseAssertsForm, TestCaseForm
 from app.routers import Permission
+from app.utils.tree_cache import ProjectTreeCache
 
 router = APIRouter(prefix="/testcase")
 
@@ -158,15 +164,38 @@ async def list_case_and_constructor(constructor_type: int):
 
 # 根据id查询具体报告内容
 @router.get("/report")
-async def query_report(id: int, user_info=Depends(Permission())):
+async def query_report(id: int, page: int = None, size: int = None, status: int = None,
+                       user_info=Depends(Permission())):
     try:
-        report, case_list = await TestReportDao.query(id)
+        report, case_list, total = await TestReportDao.query(id, page, size, status)
         return dict(code=0, data=dict(report=PityResponse.model_to_dict(report),
-                                      case_list=PityResponse.model_to_list(case_list)), msg="操作成功")
+                                      case_list=case_list), msg="操作成功", total=total)
     except Exception as e:
         return dict(code=110, msg=str(e))
 
 
+# 根据id查询单条用例执行记录的完整数据
+@router.get("/report/result")
+async def query_report_result(id: int, user_info=Depends(Permission())):
+    try:
+        result = await TestResultDao.query(id)
+        return PityResponse.success(PityResponse.model_to_dict(result))
+    except Exception as e:
+        return PityResponse.failed(e)
+
+
+# 流式导出报告中的测试结果, 支持ndjson、csv和har
+@router.get("/report/export")
+async def export_report(id: int, fmt: str = "ndjson", columns: str = None, status: int = None, gzip: bool = False,
+                        case_id: int = None, user_info=Depends(Permission())):
+    try:
+        stream, media_type, filename = ReportExporter.export(id, fmt, columns, status, gzip, case_id)
+        return StreamingResponse(stream, media_type=media_type,
+                                 headers={"Content-Disposition": f"attachment; filename={filename}"})
+    except Exception as e:
+        return PityResponse.failed(e)
+
+
 # 获取构建历史记录
 @router.get("/report/list")
 async def list_report(page: int, size: int, start_time: str, end_time: str, executor: int = None,
@@ -178,6 +207,28 @@ async def list_report(page: int, size: int, start_time: str, end_time: str, exec
         return dict(code=110, msg=str(e))
 
 
+# 获取按天汇总的报告数据, 用于看板展示
+@router.get("/report/daily")
+async def list_report_daily(start_date: str, end_date: str, project_id: int = None, plan_id: int = None,
+                            env: int = None, user_info=Depends(Permission())):
+    try:
+        data = await ReportDailyDao.list_daily(start_date, end_date, project_id, plan_id, env)
+        return PityResponse.success(data)
+    except Exception as e:
+        return PityResponse.failed(e)
+
+
+# 获取用例在一段时间内的耗时序列
+@router.get("/latency")
+async def list_case_latency(case_id: int, start_time: str, end_time: str, env: int = None,
+                            user_info=Depends(Permission())):
+    try:
+        series, stats = await TestResultDao.list_latency(case_id, start_time, end_time, env)
+        return PityResponse.success(dict(series=series, stats=stats))
+    except Exception as e:
+        return PityResponse.failed(e)
+
+
 # 获取脑图数据
 @router.get("/xmind")
 async def get_xmind_data(case_id: int, user_info=Depends(Permission())):
@@ -190,9 +241,17 @@ async def get_xmind_data(case_id: int, user_info=Depends(Permission())):
 
 # 获取case目录
 @router.get("/directory")
-async def get_testcase_directory(project_id: int, user_info=Depends(Permission())):
+async def get_testcase_directory(project_id: int, request: Request, response: Response,
+                                 user_info=Depends(Permission())):
     try:
-        tree_data, _ = await PityTestcaseDirectoryDao.get_directory_tree(project_id)
+        async def load():
+            tree, _ = await PityTestcaseDirectoryDao.get_directory_tree(project_id)
+            return tree
+
+        version, tree_data = await ProjectTreeCache.get("directory", project_id, load)
+        not_modified = ProjectTreeCache.not_modified(request, response, "directory", project_id, version)
+        if not_modified is not None:
+            return not_modified
         return PityResponse.success(tree_data)
     except Exception as e:
         return PityResponse.failed(e)
@@ -200,11 +259,19 @@ async def get_testcase_directory(project_id: int, user_info=Depends(Permission()
 
 # 获取case目录+case
 @router.get("/tree")
-async def get_directory_and_case(project_id: int, user_info=Depends(Permission())):
+async def get_directory_and_case(project_id: int, request: Request, response: Response,
+                                 user_info=Depends(Permission())):
     try:
-        tree_data, cs_map = await PityTestcaseDirectoryDao.get_directory_tree(project_id,
-                                                                              TestCaseDao.get_test_case_by_directory_id)
-        return PityResponse.success(dict(tree=tree_data, case_map=cs_map))
+        async def load():
+            tree, cs_map = await PityTestcaseDirectoryDao.get_directory_tree(project_id,
+                                                                             TestCaseDao.get_test_case_by_directory_id)
+            return dict(tree=tree, case_map=cs_map)
+
+        version, tree_data = await ProjectTreeCache.get("tree", project_id, load)
+        not_modified = ProjectTreeCache.not_modified(request, response, "tree", project_id, version)
+        if not_modified is not None:
+            return not_modified
+        return PityResponse.success(tree_data)
     except Exception as e:
         return PityResponse.failed(e)
 
@@ -0,0 +1,46 @@
+"""
+大字段压缩工具
+
+压缩后的文本以标记前缀开头(base64编码, 便于存入TEXT字段), 读取时根据前缀判断是否需要解压,
+未压缩的历史数据原样返回
+"""
+import base64
+import zlib
+
+from config import Config
+
+
+class TextCompressor(object):
+    prefix = "zlib:"
+    level = 6
+
+    @staticmethod
+    def compress(text: str, threshold: int = Config.RESULT_COMPRESS_THRESHOLD):
+        """
+        压缩文本, 过短或压缩后没有变小的文本保持原样
+        :param text:
+        :param threshold: 小于该长度的文本不压缩
+        :return:
+        """
+        if not text or not isinstance(text, str) or len(text) < threshold:
+            return text
+        data = zlib.compress(text.encode("utf-8"), TextCompressor.level)
+        compressed = TextCompressor.prefix + base64.b64encode(data).decode()
+        if len(compressed) >= len(text):
+            return text
+        return compressed
+
+    @staticmethod
+    def decompress(text: str):
+        """
+        解压文本, 兼容未压缩的数据
+        :param text:
+        :return:
+        """
+        if not text or not isinstance(text, str) or not text.startswith(TextCompressor.prefix):
+            return text
+        try:
+            return zlib.decompress(base64.b64decode(text[len(TextCompressor.prefix):])).decode("utf-8")
+        except (ValueError, zlib.error):
+            # 恰好以前缀开头的原始数据
+            return text
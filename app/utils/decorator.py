@@ -6,7 +6,9 @@ from functools import wraps
 from typing import Coroutine
 
 from redlock import RedLock, RedLockError
+from sqlalchemy import text
 
+from app.models import async_engine
 from config import Config
 
 
@@ -116,3 +118,30 @@ def lock(key):
         return wrapper
 
     return decorator
+
+
+def db_lock(key):
+    """
+    基于mysql GET_LOCK的分布式锁, 锁跟随数据库连接, 任务执行多久就持有多久, 进程退出时自动释放
+    适用于执行时间较长、无法预估锁过期时间的任务
+    :param key: 唯一key
+    :return:
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            name = f"pity:{func.__name__}:{key}"
+            async with async_engine.connect() as conn:
+                result = await conn.execute(text("SELECT GET_LOCK(:name, 0)"), dict(name=name))
+                if result.scalar() != 1:
+                    print(f"进程: {os.getpid()}获取任务失败, 不用担心，还有其他哥们给你执行了")
+                    return
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    await conn.execute(text("SELECT RELEASE_LOCK(:name)"), dict(name=name))
+
+        return wrapper
+
+    return decorator
@@ -4,6 +4,8 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 from app.core.executor import Executor
+from app.core.retention import ReportPurger
+from config import Config
 
 
 class Scheduler(object):
@@ -27,6 +29,16 @@ class Scheduler(object):
                                            name=plan_name, id=str(plan_id),
                                            trigger=CronTrigger.from_crontab(cron))
 
+    @staticmethod
+    def add_report_purge():
+        """
+        添加清理过期报告的定时任务
+        :return:
+        """
+        return Scheduler.scheduler.add_job(func=ReportPurger.purge, name="清理过期报告", id="pity_report_purge",
+                                           trigger=CronTrigger.from_crontab(Config.RETENTION_CRON),
+                                           replace_existing=True)
+
     @staticmethod
     def edit_test_plan(plan_id, plan_name, cron):
         """
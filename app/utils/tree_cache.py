@@ -0,0 +1,136 @@
+"""
+项目用例树缓存
+
+每个项目维护一个版本号(存放在redis, 多进程共享), 目录/用例发生增删改时版本号+1,
+渲染好的树按版本号缓存在进程内和redis中, 同时用版本号生成ETag, 浏览器无变化时直接返回304
+版本号由随机epoch和计数组成, 存放在同一个hash中, redis被清空或key被淘汰后会生成新的epoch, 旧的ETag不会被误判为未修改
+"""
+import json
+import time
+import uuid
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.middleware.RedisManager import RedisHelper
+from app.utils.logger import Log
+
+
+class ProjectTreeCache(object):
+    log = Log("ProjectTreeCache")
+    # 进程内缓存: (kind, project_id) -> (version, data, 缓存时间)
+    _local = dict()
+    # 缓存过期时间, 版本号丢失(如redis被清空)时兜底
+    expired_time = 30 * 60
+
+    @staticmethod
+    def version_key(project_id: int):
+        return RedisHelper.get_key("tree_state:", project_id)
+
+    @staticmethod
+    async def get_version(project_id: int):
+        """
+        获取项目树当前版本号，redis不可用时返回None, 此时不走缓存
+        :param project_id:
+        :return: epoch-计数
+        """
+        key = ProjectTreeCache.version_key(project_id)
+        try:
+            state = await RedisHelper.pity_redis_client.hgetall(key)
+            if not state.get("epoch"):
+                # 版本号丢失或首次使用, 生成新的epoch, 多个进程同时生成时以先写入的为准
+                await RedisHelper.pity_redis_client.hsetnx(key, "epoch", uuid.uuid4().hex[:12])
+                state = await RedisHelper.pity_redis_client.hgetall(key)
+            return f"{state['epoch']}-{state.get('counter', 0)}"
+        except Exception as e:
+            ProjectTreeCache.log.error(f"获取项目: {project_id}用例树版本失败, error: {e}")
+            return None
+
+    @staticmethod
+    def bump(*project_ids):
+        """
+        目录或用例发生变化时调用，使项目树缓存失效, 供同步的DAO使用
+        :param project_ids:
+        :return:
+        """
+        for project_id in set(project_ids):
+            if project_id is None:
+                continue
+            try:
+                RedisHelper.pity_redis_sync_client.hincrby(ProjectTreeCache.version_key(project_id), "counter", 1)
+            except Exception as e:
+                ProjectTreeCache.log.error(f"更新项目: {project_id}用例树版本失败, error: {e}")
+            ProjectTreeCache.drop_local(project_id)
+
+    @staticmethod
+    async def async_bump(*project_ids):
+        """
+        bump的异步版本, 供异步的DAO使用, 不阻塞事件循环
+        :param project_ids:
+        :return:
+        """
+        for project_id in set(project_ids):
+            if project_id is None:
+                continue
+            try:
+                await RedisHelper.pity_redis_client.hincrby(ProjectTreeCache.version_key(project_id), "counter", 1)
+            except Exception as e:
+                ProjectTreeCache.log.error(f"更新项目: {project_id}用例树版本失败, error: {e}")
+            ProjectTreeCache.drop_local(project_id)
+
+    @staticmethod
+    def drop_local(project_id: int):
+        # 本进程的旧数据直接丢弃
+        for key in [k for k in ProjectTreeCache._local if k[1] == project_id]:
+            ProjectTreeCache._local.pop(key, None)
+
+    @staticmethod
+    async def get(kind: str, project_id: int, loader):
+        """
+        获取项目树，优先读取进程内缓存，其次redis，最后调用loader从数据库构建
+        :param kind: 树的类型, 如directory, tree
+        :param project_id: 项目id
+        :param loader: 构建树的异步方法, 返回值需可被json序列化
+        :return: 版本号, 树数据
+        """
+        version = await ProjectTreeCache.get_version(project_id)
+        if version is None:
+            return None, await loader()
+        local = ProjectTreeCache._local.get((kind, project_id))
+        if local is not None and local[0] == version and time.time() - local[2] < ProjectTreeCache.expired_time:
+            return version, local[1]
+        redis_key = RedisHelper.get_key(f"tree:{kind}:", project_id, version)
+        data = None
+        try:
+            cache = await RedisHelper.pity_redis_client.get(redis_key)
+            if cache is not None:
+                data = json.loads(cache)
+        except Exception as e:
+            ProjectTreeCache.log.error(f"读取项目: {project_id}用例树缓存失败, error: {e}")
+        if data is None:
+            data = await loader()
+            try:
+                await RedisHelper.pity_redis_client.set(redis_key, json.dumps(data, ensure_ascii=False),
+                                                        ex=ProjectTreeCache.expired_time)
+            except Exception as e:
+                ProjectTreeCache.log.error(f"写入项目: {project_id}用例树缓存失败, error: {e}")
+        ProjectTreeCache._local[(kind, project_id)] = (version, data, time.time())
+        return version, data
+
+    @staticmethod
+    def etag(kind: str, project_id: int, version: str):
+        return f'W/"{kind}-{project_id}-{version}"'
+
+    @staticmethod
+    def not_modified(request: Request, response: Response, kind: str, project_id: int, version):
+        """
+        设置ETag, 如果客户端带过来的If-None-Match与当前版本一致则返回304响应
+        :return: 304响应或None
+        """
+        if version is None:
+            return None
+        etag = ProjectTreeCache.etag(kind, project_id, version)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        return None
@@ -0,0 +1,36 @@
+"""
+pity命令行工具
+
+    python cli.py backfill-daily --start 2021-01-01 --end 2021-12-31
+"""
+import argparse
+import asyncio
+from datetime import date, datetime
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+async def backfill_daily(args):
+    # 导入dao时会连接数据库并建表, 放在命令内部导入
+    import app.crud
+    from app.crud.test_case.ReportDailyDao import ReportDailyDao
+    total = await ReportDailyDao.backfill(args.start, args.end)
+    print(f"回填完成, 共处理{total}份报告")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pity命令行工具")
+    sub = parser.add_subparsers(dest="command")
+    sub.required = True
+    backfill = sub.add_parser("backfill-daily", help="根据历史报告重新生成按天汇总数据")
+    backfill.add_argument("--start", type=parse_date, required=True, help="开始日期, 如2021-01-01")
+    backfill.add_argument("--end", type=parse_date, default=date.today(), help="结束日期(包含), 默认今天")
+    backfill.set_defaults(func=backfill_daily)
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -18,6 +18,21 @@ class Config(object):
     REDIS_PORT = 7788
     REDIS_DB = 0
     REDIS_PASSWORD = "woodywu"
+    # 每个redis配置(集群为每个节点)的最大连接数
+    REDIS_MAX_CONNECTIONS = 100
+    # 连接空闲超过该时间(秒)后, 下次使用前先PING检查连接是否可用
+    REDIS_HEALTH_CHECK_INTERVAL = 30
+    # 建立redis连接的超时时间(秒)
+    REDIS_CONNECT_TIMEOUT = 5
+    # 进程内缓存的lua脚本数量
+    REDIS_SCRIPT_CACHE_SIZE = 256
+    # key浏览器每页默认数量/最大数量, list和zset单次读取的最大元素数也使用该值
+    REDIS_SCAN_COUNT = 100
+    REDIS_SCAN_MAX_COUNT = 1000
+    # key浏览器每页最多调用SCAN的次数
+    REDIS_SCAN_MAX_CALLS = 10
+    # string单次读取的最大字节数
+    REDIS_VALUE_MAX_BYTES = 64 * 1024
 
     # Redis连接信息
     REDIS_NODES = [{"host": REDIS_HOST, "port": REDIS_PORT, "db": REDIS_DB, "password": REDIS_PASSWORD}]
@@ -61,6 +76,83 @@ class Config(object):
 
     SERVER_REPORT = "http://test.pity.fun/#/record/report/"
 
+    # 测试结果中response, case_log, headers超过该长度会被压缩存储
+    RESULT_COMPRESS_THRESHOLD = 512
+
+    # 测试计划结果存储策略为保留样本时, 成功用例的response和日志截取的长度
+    RESULT_SAMPLE_SIZE = 2048
+
+    # 报告中用例执行记录分页查询时每页最大数量
+    RESULT_MAX_PAGE_SIZE = 200
+
+    # 报告保留策略默认值, 可以在保留策略中按项目/测试计划覆盖, None表示不限制
+    # 默认不清理, 需要物理删除报告时再配置
+    RETENTION_RUNS = None
+    RETENTION_DAYS = None
+    RETENTION_FAILED_DAYS = None
+    # 清理过期报告的cron表达式
+    RETENTION_CRON = "0 3 * * *"
+    # 每批删除的数量以及批次之间的间隔(秒)
+    PURGE_BATCH_SIZE = 500
+    PURGE_INTERVAL = 0.2
+    # 新写入的response内容在该时间(分钟)内不会被清理, 避免删除测试结果还未提交的内容
+    RESPONSE_BLOB_GC_GRACE = 30
+    # pity_test_result是否已按月分区, 开启后会直接删除过期的分区
+    RESULT_PARTITION = False
+
+    # 耗时基线取该用例在同一环境下最近N次成功执行的请求耗时
+    LATENCY_BASELINE_RUNS = 30
+    # 样本数不足时不做基线断言
+    LATENCY_BASELINE_MIN_RUNS = 5
+    # 基线使用的百分位
+    LATENCY_BASELINE_PERCENTILE = 95
+
+    # 测试计划单个环境同时执行的测试数据数量, 顺序执行的计划只在开启快速失败时限制
+    PLAN_MAX_CONCURRENCY = 20
+    # 数据源(用户配置的数据库)连接池配置
+    DATASOURCE_POOL_SIZE = 5
+    DATASOURCE_MAX_OVERFLOW = 10
+    # 获取连接的等待时间(秒)
+    DATASOURCE_POOL_TIMEOUT = 10
+    # 使用连接前检查连接是否可用
+    DATASOURCE_PRE_PING = True
+    # 建立连接超时时间(秒)
+    DATASOURCE_CONNECT_TIMEOUT = 5
+    # 单条SQL执行超时时间(秒), 可以在数据源和sql构造方法中单独配置, 由数据库服务端中断超时的语句
+    DATASOURCE_QUERY_TIMEOUT = 30
+    # 服务端超时未生效时(如mysql的非select语句), 客户端在超时时间基础上再等待的时间(秒)
+    DATASOURCE_TIMEOUT_GRACE = 5
+    # 构造方法结果缓存的最大数量(按ttl缓存的部分)
+    CONSTRUCTOR_CACHE_SIZE = 1024
+
+    # python脚本执行进程数
+    SCRIPT_MAX_WORKERS = 2
+    # python脚本默认超时时间(秒), 同时限制cpu时间, 超过宽限时间仍未返回则结束工作进程
+    SCRIPT_TIMEOUT = 10
+    SCRIPT_TIMEOUT_GRACE = 5
+    # python脚本工作进程的内存限制(MB), 不包含工作进程启动时已占用的内存
+    SCRIPT_MEMORY_LIMIT = 512
+    # 每个工作进程缓存的编译后脚本数量
+    SCRIPT_CODE_CACHE_SIZE = 128
+
+    # 在线SQL每页返回的最大行数、最大字节数
+    ONLINE_SQL_MAX_ROWS = 1000
+    ONLINE_SQL_MAX_BYTES = 4 * 1024 * 1024
+    # 数据库表结构缓存时间(秒)
+    SCHEMA_CACHE_TTL = 30 * 60
+    # 同时反射表结构的数据库数量, 以及单个数据库的反射超时时间(秒)
+    SCHEMA_REFLECT_CONCURRENCY = 8
+    SCHEMA_REFLECT_TIMEOUT = 15
+    # 每个进程最多缓存的数据源连接池数量, 超过后淘汰最久未使用的
+    DATASOURCE_MAX_ENGINES = 64
+    # 连接池闲置超过该时间(秒)后释放
+    DATASOURCE_IDLE_TIMEOUT = 10 * 60
+
+    # 无序测试计划按最近N天的平均耗时从长到短执行
+    PLAN_ESTIMATE_DAYS = 30
+    # 快速失败时统计失败率的滑动窗口大小
+    FAIL_FAST_WINDOW = 20
+
     ALIYUN = "aliyun"
     GITEE = "gitee"
 
@@ -73,6 +165,15 @@ class Config(object):
         binary = 4
         graphQL = 5
 
+    # 测试结果存储策略
+    class ResultStorage:
+        # 全部保存
+        full = 0
+        # 成功的用例只保存状态、状态码、耗时、断言等概要信息
+        failed_only = 1
+        # 同failed_only, 但保留截断后的response和日志
+        failed_with_sample = 2
+
     # 前置条件类型
     class ConstructorType:
         testcase = 0